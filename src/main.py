@@ -4,19 +4,61 @@ Author: Yuya Jeremy Ong (yjo5006@psu.edu)
 '''
 from __future__ import print_function
 import sys
+import math
 import argparse
 from server import ADAM, AMPA, CAMPR3, DBAASP
+from server.cache import PredictionCache
+from server.journal import Journal
+from server.hosts import load_hosts
+from server.profiles import load_profiles
+from server.batching import load_sizes, get_controller
+from server.scheduler import Scheduler
+from util.fasta import Fasta
+from util.store import ResultStore
+
+# Model Name, Display Name, Output Prefix, Missing Output Filename (None if Unsupported)
+MODELS = [
+    ('AMPA', 'AMPA', 'AMPA', None),                                         # PARTIALLY-VERIFIED (NON-ROBUST/STABLE)
+    ('DBAASP', 'DBAASP', 'DBAASP', 'MISSING_DBAASP.csv'),                   # VERIFIED
+    ('ADAM_SVM', 'ADAM_SVM', 'ADAM-SVM', 'MISSING_ADAM-SVM.csv'),           # VERIFIED
+    ('ADAM_HMM', 'ADAM_HMM', 'ADAM-HMM', None),                             # VERIFIED
+    ('CMPR3_SVM', 'CAMPR3_SVM', 'CAMPR3-SVM', '{}_MISSING_CAMPR3-SVM.csv'), # STABLE
+    ('CMPR3_RF', 'CAMPR3_RF', 'CAMPR3-RF', None),                           # STABLE
+    ('CMPR3_ANN', 'CAMPR3_ANN', 'CAMPR3-ANN', None),                        # STABLE
+    ('CMPR3_DA', 'CAMPR3_DA', 'CAMPR3-DA', 'MISSING_CMPR3-DA.csv')
+]
 
 def parse_arg():
     # TODO: Consider index/ID based batch processing. Give parameter to start from certain indexself.
     parser = argparse.ArgumentParser()
     parser.add_argument("--ls", action="store_true", help="List all available servers.")
     parser.add_argument('--data', type=str, help='Path to dataset (Must be in FASTA format).')
+    parser.add_argument('--dataset', type=str, help='Dataset name results are stored under (default: --data file name, without validation\'s <server>_ prefix for --missing runs).')
     parser.add_argument('--out', type=str, help='Path to result output.')
-    parser.add_argument('--model', type=str, help='Model server to use. (Use ls to find the model names).')
+    parser.add_argument('--model', type=str, help='Model server(s) to use, comma separated. (Use ls to find the model names).')
     parser.add_argument('--batch_size', type=int, default=50, help='Number of data to handle per batch transaction.')
     parser.add_argument('--start_id', type=str, help='Specify ID for starting index for batch processing.')
     parser.add_argument('--job_size', type=int, help='How many samples to submit per job.')
+    parser.add_argument('--workers', type=int, default=1, help='Number of browser instances to run batches in parallel.')
+    parser.add_argument('--ampa_jobs', type=int, default=1, help='Number of AMPA jobs to keep in flight (uses asyncio client if > 1).')
+    parser.add_argument('--ampa_hedge', type=float, help='Hedge AMPA jobs running past this percentile (e.g. 0.9) of recent job durations.')
+    parser.add_argument('--hedge_budget', type=float, default=0.1, help='Maximum fraction of AMPA jobs that may be hedged.')
+    parser.add_argument('--cache', type=str, default='../data/cache/predictions.db', help='Path to persistent prediction cache.')
+    parser.add_argument('--cache_size', type=int, default=1000000, help='Maximum number of cached predictions.')
+    parser.add_argument('--no_cache', action='store_true', help='Disable the prediction cache.')
+    parser.add_argument('--store', type=str, default='../data/results.db', help='Path to result store (results keyed by dataset, server and PepID).')
+    parser.add_argument('--no_store', action='store_true', help='Do not append results to the result store.')
+    parser.add_argument('--transport', type=str, default='selenium', choices=['selenium', 'http'], help='Transport for form based servers (http falls back to selenium on failure).')
+    parser.add_argument('--adam_transport', type=str, default='http', choices=['selenium', 'http'], help='Transport for ADAM (selenium only when explicitly requested).')
+    parser.add_argument('--campr3_multi', action='store_true', help='Fetch all selected CAMPR3 modes in one form submission.')
+    parser.add_argument('--hosts', type=str, default='../data/hosts.csv', help='Per-host concurrency and politeness limits.')
+    parser.add_argument('--batch_state', type=str, default='../data/cache/batch_sizes.json', help='Path to learned per-server batch sizes.')
+    parser.add_argument('--fixed_batch', action='store_true', help='Disable adaptive batch sizing (always use --batch_size).')
+    parser.add_argument('--profiles', type=str, default='../data/server_profiles.csv', help='Per-server sequence constraints checked before submission.')
+    parser.add_argument('--split', type=int, default=4, help='Number of ways to split a failed batch when isolating failing records.')
+    parser.add_argument('--resume', action='store_true', help='Resume from result journal, skipping completed records.')
+    parser.add_argument('--retry', type=int, help='Resubmit only records imputed (-999) in the result store within --start_id/--job_size, at most this many times each.')
+    parser.add_argument('--retry_absent', action='store_true', help='With --retry, also submit records in range never written to the result store.')
     parser.add_argument('--missing', type=bool, default=False, help='If provided, will only process the indexed values listed.')
     return parser.parse_args()
 
@@ -36,104 +78,223 @@ def list_server():
     for s in servers: print('> ' + s)
     sys.exit()
 
-def read_fasta(data_dir):
-    return open(data_dir, 'r').read().split('\n')[:-1]
+def report_cache(cache):
+    if cache is None: return
+    print('> CACHE HIT RATE: {:.2f}% ({} / {})'.format(cache.hit_rate() * 100, cache.hits, cache.hits + cache.misses))
+    cache.reset_stats()
 
-def find_idx(data, pid):
-    index = 0
-    for d in data:
-        if d[1:] == pid: break
-        index += 1
-    return index
+# Collapse Identical Sequences - Returns Unique FASTA and Duplicate PepID Groups
+def dedup(data):
+    first = {}
+    groups = {}
+    uniq = []
+    for i in range(0, len(data), 2):
+        pid, seq = data[i][1:], data[i+1]
+        if seq in first:
+            groups[first[seq]].append(pid)
+        else:
+            first[seq] = pid
+            groups[pid] = []
+            uniq += data[i:i+2]
+    return uniq, groups
+
+def report_dedup(data, uniq, batch_size):
+    saved = (len(data) - len(uniq)) // 2
+    batches = int(math.ceil(len(data) / 2.0 / batch_size)) - int(math.ceil(len(uniq) / 2.0 / batch_size))
+    print('> DEDUP: ' + str(len(uniq) // 2) + ' UNIQUE SEQUENCES - SAVED ' + str(saved) + ' SUBMISSIONS (' + str(batches) + ' BATCHES)\n')
 
-def write_log(out_dir, data):
+# Fan Out Results to PepIDs Sharing the Sequence
+def fan_out(data, groups=None):
+    if groups is None: return data
+    out = []
+    for d in data: out += [d] + [[pid, d[1], d[2]] for pid in groups.get(d[0], [])]
+    return out
+
+def write_log(out_dir, data, groups=None):
     out = open(out_dir, 'w')
     out.write('PepID,AMPLabel,Prob\n')
-    for d in data: out.write(d[0] + ',' + str(d[1]) + ',' + str(d[2]) + '\n')
+    for d in fan_out(data, groups): out.write(d[0] + ',' + str(d[1]) + ',' + str(d[2]) + '\n')
     out.close()
 
+def build_server(args, model, data, batch_size, controller, cache, on_batch):
+    if isinstance(model, list):
+        # Multi-Mode CAMPR3 (All Algorithms in One Submission)
+        return CAMPR3.CAMPR3(data, mode=[m.split('_')[1] for m in model], batch_size=batch_size, workers=args.workers,
+                             cache=cache, on_batch={m.split('_')[1] : on_batch[m] for m in model}, transport=args.transport,
+                             controller=controller)
+    if model == 'AMPA':
+        if args.ampa_jobs > 1 or args.ampa_hedge is not None:
+            return AMPA.AsyncAMPA(data, batch_size=batch_size, max_jobs=args.ampa_jobs, cache=cache, on_batch=on_batch,
+                                  split=args.split, controller=controller, hedge=args.ampa_hedge,
+                                  hedge_budget=args.hedge_budget)
+        return AMPA.AMPA(data, batch_size=batch_size, cache=cache, on_batch=on_batch, split=args.split, controller=controller)
+    if model == 'DBAASP':
+        return DBAASP.DBAASP(data, batch_size=batch_size, workers=args.workers, cache=cache, on_batch=on_batch,
+                             transport=args.transport, split=args.split, controller=controller)
+    if model.startswith('ADAM_'):
+        return ADAM.ADAM(data, mode=model.split('_')[1], batch_size=batch_size, workers=args.workers,
+                         cache=cache, on_batch=on_batch, transport=args.adam_transport, split=args.split, controller=controller)
+    if model.startswith('CMPR3_'):
+        return CAMPR3.CAMPR3(data, mode=model.split('_')[1], batch_size=batch_size, workers=args.workers,
+                             cache=cache, on_batch=on_batch, transport=args.transport, controller=controller)
+
+# Result Store Dataset Key - Retry FASTA Files from Validation (<server>_<dataset>) Map Back to Original Dataset
+def dataset_name(args):
+    if args.dataset is not None: return args.dataset
+    name = args.data.split('/')[-1]
+    if args.missing:
+        for model, _, _, _ in MODELS:
+            if name.startswith(model + '_'): return name[len(model) + 1:]
+    return name
+
+# Records of Range Imputed in Result Store - or Never Written if Absent (Within Retry Budget)
+# Each Counted as One Retry Attempt
+def retry_job(fasta, store, dataset, model, budget, st=0, ed=None, absent=False):
+    ids, labels, _ = store.columns(dataset, model)
+    done, stored = set(ids[labels != -999].tolist()), set(ids.tolist())
+    attempts = store.attempts(dataset, model)
+    data, spent = [], 0
+    for i, pid in enumerate(fasta.ids(st, ed), st):
+        if pid in done or (not absent and pid not in stored): continue
+        if attempts.get(pid, 0) >= budget:
+            spent += 1
+            continue
+        data += ['>' + pid, fasta.seq(i)]
+    store.retried(dataset, model, [d[1:] for d in data[::2]])
+    print('> RETRY [' + model + ']: ' + str(len(data) // 2) + ' RECORDS (' + str(spent) + ' OUT OF RETRY BUDGET)')
+    return dedup(data)
+
+# Drop Records Already Completed in Every Journal
+def skip_done(data, journals):
+    pending = []
+    for i in range(0, len(data), 2):
+        if any(data[i][1:] not in j for j in journals): pending += data[i:i+2]
+    return pending
+
+# Run Server Job - models/out_files Hold Several Entries for Multi-Mode CAMPR3
+def process(args, models, out_files, job, groups, cache, store, profiles, progress):
+    # Stream Batch Results to Journal (Resumed Runs Skip Completed Records)
+    journals = [Journal(f + '.journal', resume=args.resume) for f in out_files]
+    pending = skip_done(job, journals)
+    if args.resume: print('> RESUMING [' + ','.join(models) + ']: ' + str((len(job) - len(pending)) // 2) + ' RECORDS ALREADY COMPLETED')
+    progress((len(job) - len(pending)) // 2)
+
+    # Batch Results Also Appended to Result Store (Keyed by Dataset File Name and Model)
+    def on_batch(journal, model, report):
+        def append(res):
+            journal.append(res)
+            if store is not None: store.append(args.dataset, model, fan_out(res, groups))
+            if report: progress(len(res))
+        return append
+
+    callbacks = {m : on_batch(j, m, k == 0) for k, (m, j) in enumerate(zip(models, journals))}
+
+    # Pre-Flight Check - Records Rejected by Any Profile are Imputed (with -999) Without Submission
+    batch_size, max_batch = args.batch_size, None
+    for m in models:
+        if m not in profiles: continue
+        pending, rejected = profiles[m].preflight(pending)
+        batch_size = profiles[m].batch_size(batch_size)
+        if profiles[m].max_batch is not None: max_batch = min(max_batch or profiles[m].max_batch, profiles[m].max_batch)
+        if len(rejected) == 0: continue
+        print('> PRE-FLIGHT [' + m + ']: ' + str(len(rejected)) + ' SEQUENCES REJECTED')
+        for c in callbacks.values(): c([[pid, -999, -999] for pid in rejected])
+
+    # Adaptive Batch Size (Starts from Size Learned in Previous Runs)
+    controller = None if args.fixed_batch else get_controller('+'.join(models), size=batch_size, max_size=max_batch)
+
+    if len(models) == 1: srv = build_server(args, models[0], pending, batch_size, controller, cache, callbacks[models[0]])
+    else: srv = build_server(args, models, pending, batch_size, controller, cache, callbacks)
+    srv.predict()
+
+    # Write Final Output in Dataset Order
+    for out_file, journal in zip(out_files, journals):
+        journal.close()
+        write_log(out_file, [journal.rows[d[1:]] for d in job[::2] if d[1:] in journal], groups)
+
 if __name__ == '__main__':
     args = parse_arg()          # Parse Arguments
     if args.ls: list_server()   # List Servers
 
-    # Load Dataset
+    # Load Dataset (Indexed and Memory-Mapped - Only the Job Range is Read)
     print('> LOADING DATA FILE: ' + str(args.data))
     if args.data is not None:
-        data = read_fasta(args.data)
+        fasta = Fasta(args.data)
     else:
         print('> ERROR: Please provide valid FASTA dataset path.')
         sys.exit()
-    print('> LOADED ' + str(len(data)) + ' AMP SAMPLES\n')
+    print('> LOADED ' + str(len(fasta)) + ' AMP SAMPLES\n')
+    args.dataset = dataset_name(args)
 
+    # Initialize Prediction Cache
+    cache = None if args.no_cache else PredictionCache(args.cache, max_entries=args.cache_size)
+    store = None if args.no_store else ResultStore(args.store)
+    if args.retry is not None and store is None:
+        print('> ERROR: --retry reads failed records from the result store (remove --no_store).')
+        sys.exit()
+
+    st, ed = 0, 2 * len(fasta)
     if not args.missing:
-        # Find Start ID
+        # Find Start ID (Line Index)
         if args.start_id is not None:
-            st = find_idx(data, args.start_id)
+            idx = fasta.find(args.start_id)
+            st = 2 * (idx if idx is not None else len(fasta))
         else: st = 0
 
         # Compute End Index
         if args.job_size is not None:
-            if st + (args.job_size * 2) >= len(data): ed = len(data)
+            if st + (args.job_size * 2) >= 2 * len(fasta): ed = 2 * len(fasta)
             else: ed = st + (args.job_size * 2)
-        else: ed = len(data)
-
-    # Process Predictions
-    if args.model == 'ALL' or args.model == 'AMPA':     # PARTIALLY-VERIFIED (NON-ROBUST/STABLE)
-        print('[PROCESSING: AMPA]')
-        if args.missing == False:
-            srv = AMPA.AMPA(data[st:ed], batch_size=args.batch_size)
-            write_log(args.out + '/' + 'AMPA' + '_' + str(st) + '_' + str(ed)  + '.csv', srv.predict())
-
-    if args.model == 'ALL' or args.model == 'DBAASP':   # VERIFIED
-        print('[PROCESSING: DBAASP]')
-        if args.missing == False:
-            srv = DBAASP.DBAASP(data[st:ed], batch_size=args.batch_size)
-            write_log(args.out + '/' + 'DBAASP' + '_' + str(st) + '_' + str(ed) + '.csv', srv.predict())
-        else:
-            srv = DBAASP.DBAASP(data, batch_size=args.batch_size)
-            write_log(args.out + '/' + 'MISSING_DBAASP.csv', srv.predict())
-
-    if args.model == 'ALL' or args.model == 'ADAM_SVM': # VERIFIED
-        print('[PROCESSING: ADAM_SVM]')
-        if args.missing == False:
-            srv = ADAM.ADAM(data[st:ed], mode='SVM', batch_size=args.batch_size)
-            write_log(args.out + '/' + 'ADAM-SVM' + '_' + str(st) + '_' + str(ed) + '.csv', srv.predict())
-        else:
-            srv = ADAM.ADAM(data, mode='SVM', batch_size=args.batch_size)
-            write_log(args.out + '/' + 'MISSING_ADAM-SVM.csv', srv.predict())
-
-    if args.model == 'ALL' or args.model == 'ADAM_HMM': # VERIFIED
-        print('[PROCESSING: ADAM_HMM]')
-        if args.missing == False:
-            srv = ADAM.ADAM(data[st:ed], mode='HMM', batch_size=args.batch_size)
-            write_log(args.out + '/' + 'ADAM-HMM' + '_' + str(st) + '_' + str(ed) + '.csv', srv.predict())
-
-    if args.model == 'ALL' or args.model == 'CMPR3_SVM':    # STABLE
-        print('[PROCESSING: CAMPR3_SVM]')
-        if args.missing == False:
-            srv = CAMPR3.CAMPR3(data[st:ed], mode='SVM', batch_size=args.batch_size)
-            write_log(args.out + '/' + 'CAMPR3-SVM' + '_' + str(st) + '_' + str(ed) + '.csv', srv.predict())
-        else:
-            srv = CAMPR3.CAMPR3(data, mode='SVM', batch_size=args.batch_size)
-            write_log(args.out + '/' + args.data.split('/')[-1] + '_MISSING_CAMPR3-SVM.csv', srv.predict())
-
-    if args.model == 'ALL' or args.model == 'CMPR3_RF':     # STABLE
-        print('[PROCESSING: CAMPR3_RF]')
-        if args.missing == False:
-            srv = CAMPR3.CAMPR3(data[st:ed], mode='RF', batch_size=args.batch_size)
-            write_log(args.out + '/' + 'CAMPR3-RF' + '_' + str(st) + '_' + str(ed) + '.csv', srv.predict())
-
-    if args.model == 'ALL' or args.model == 'CMPR3_ANN':    # STABLE
-        print('[PROCESSING: CAMPR3_ANN]')
-        if args.missing == False:
-            srv = CAMPR3.CAMPR3(data[st:ed], mode='ANN', batch_size=args.batch_size)
-            write_log(args.out + '/' + 'CAMPR3-ANN' + '_' + str(st) + '_' + str(ed) + '.csv', srv.predict())
-
-    if args.model == 'ALL' or args.model == 'CMPR3_DA':
-        print('[PROCESSING: CAMPR3_DA]')
-        if args.missing == False:
-            srv = CAMPR3.CAMPR3(data[st:ed], mode='DA', batch_size=args.batch_size)
-            write_log(args.out + '/' + 'CAMPR3-DA' + '_' + str(st) + '_' + str(ed) + '.csv', srv.predict())
-        else:
-            srv = CAMPR3.CAMPR3(data, mode='DA', batch_size=args.batch_size)
-            write_log(args.out + '/' + 'MISSING_CMPR3-DA.csv', srv.predict())
+        else: ed = 2 * len(fasta)
+
+    # Retry Runs Build Per-Server Jobs from Result Store Instead
+    if args.retry is not None: data = []
+    else: data = fasta.lines() if args.missing else fasta.lines(st // 2, ed // 2)
+
+    # Collapse Duplicate Sequences (Results Fanned Out in write_log)
+    job, groups = dedup(data)
+    if args.retry is None: report_dedup(data, job, args.batch_size)
+
+    # Per-Host Concurrency and Politeness Limits
+    load_hosts(args.hosts)
+    profiles = load_profiles(args.profiles)
+    if not args.fixed_batch: load_sizes(args.batch_state)
+
+    # Schedule Selected Servers (Run Concurrently, Each Host Under Its Own Budget)
+    scheduler = Scheduler()
+    selected = args.model.split(',') if args.model is not None else []
+    campr3 = ([], [])
+    for model, name, prefix, missing in MODELS:
+        if 'ALL' not in selected and model not in selected: continue
+        print('[PROCESSING: ' + name + ']')
+
+        # Retry Failed Records Only - Successes Replace -999 Rows in Result Store
+        if args.retry is not None:
+            retry, retry_groups = retry_job(fasta, store, args.dataset, model, args.retry, st // 2, ed // 2, args.retry_absent)
+            if len(retry) == 0: continue
+            out_file = args.out + '/' + prefix + '_RETRY.csv'
+            scheduler.add(name, len(retry) // 2,
+                          lambda progress, model=model, out_file=out_file, retry=retry, retry_groups=retry_groups:
+                          process(args, [model], [out_file], retry, retry_groups, cache, store, profiles, progress))
+            continue
+
+        if not args.missing:
+            out_file = args.out + '/' + prefix + '_' + str(st) + '_' + str(ed) + '.csv'
+        elif missing is not None:
+            out_file = args.out + '/' + missing.format(args.data.split('/')[-1])
+        else: continue
+
+        # Defer CAMPR3 Modes to Single Multi-Mode Job
+        if args.campr3_multi and model.startswith('CMPR3_'):
+            campr3[0].append(model)
+            campr3[1].append(out_file)
+            continue
+
+        scheduler.add(name, len(job) // 2,
+                      lambda progress, model=model, out_file=out_file: process(args, [model], [out_file], job, groups, cache, store, profiles, progress))
+
+    if len(campr3[0]) > 0:
+        scheduler.add('CAMPR3', len(job) // 2, lambda progress: process(args, campr3[0], campr3[1], job, groups, cache, store, profiles, progress))
+    scheduler.run()
+    report_cache(cache)
+    if store is not None: store.close()
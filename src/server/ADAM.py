@@ -3,155 +3,153 @@ ADAM - Batch Prediction Routine
 Author: Yuya Jeremy Ong (yjo5006@psu.edu)
 '''
 from __future__ import print_function
-import time
-import requests
 from bs4 import BeautifulSoup
-
-from selenium import webdriver
 from selenium.webdriver.common.by import By
-from selenium.webdriver.common.keys import Keys
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
+
+from server.pool import get_pool
+from server.hosts import get_host, HostUnavailable
+from util.fasta import read_fasta
+from server.session import get_session
+from server.isolate import FaultIsolator
+from server.batching import BatchController, run_batches
 
 # Application Parameters
 ROOT_URL = 'http://bioinformatics.cs.ntou.edu.tw/ADAM/'
+TIMEOUT = 300   # Seconds per request before host counts as unreachable (Batch predictions run in request)
 
 ACTION_URL_SVM = ROOT_URL + 'svm_predict.php'
 ACTION_URL_HMM = ROOT_URL + 'hmm_predict.php'
-ACTION_URL = ACTION_URL_SVM
 
 FORM_URL_SVM = ROOT_URL + 'svm_tool.html'
 FORM_URL_HMM = ROOT_URL + 'hmm_tool.html'
-FORM_URL = FORM_URL_HMM
+
+# Result Table Label Column and Values per Mode (Column, AMP, Non-AMP)
+LABELS = {
+    'SVM' : (3, 'AMP', 'Non AMP'),
+    'HMM' : (4, 'Antimicrobial Peptide', 'NON-Antimicrobial Peptide')
+}
 
 class ADAM(object):
-    def __init__(self, fasta_data, mode='SVM', batch_size=50, sleep=5):
+    def __init__(self, fasta_data, mode='SVM', batch_size=50, workers=1, cache=None, on_batch=None,
+                 transport='http', split=4, controller=None):
         # Class Parameters
         self.data = fasta_data
+        self.cache = cache
+        self.on_batch = on_batch    # Callback receiving each completed batch
         self.batch_size = batch_size * 2
         self.mode = mode    # SVM or HMM
-        self.sleep = sleep
+        self.workers = workers
+        self.transport = transport  # http or selenium
+
+        # Batch Size Controller (Fixed batch_size Unless Adaptive Controller Given)
+        self.controller = controller if controller is not None else BatchController(size=batch_size, adaptive=False)
 
         if self.mode == 'SVM':
-            ACTION_URL = ACTION_URL_SVM
-            FORM_URL = FORM_URL_SVM
+            self.action_url = ACTION_URL_SVM
+            self.form_url = FORM_URL_SVM
         elif self.mode == 'HMM':
-            print('use HMM')
-            ACTION_URL = ACTION_URL_HMM
-            FORM_URL = FORM_URL_HMM
+            self.action_url = ACTION_URL_HMM
+            self.form_url = FORM_URL_HMM
+
+        self.session = get_session(ROOT_URL, size=workers)
+
+        # Failed Batches are Split k Ways to Isolate Offending Records
+        self.isolator = FaultIsolator(self.process_job, k=split, workers=workers, on_submit=self.controller.observe)
+
+    # Prediction Cache Lookup - Drops Cached Records from Submission
+    def _cache_lookup(self):
+        if self.cache is None: return []
+        hits, self.data = self.cache.lookup('ADAM', self.mode, None, self.data)
+        if self.on_batch is not None: self.on_batch(hits)
+        return hits
+
+    # Batch Completion - Store in Cache and Notify Callback
+    def _complete(self, data, res):
+        if self.cache is not None: self.cache.store('ADAM', self.mode, None, data, res)
+        if self.on_batch is not None: self.on_batch(res)
 
     def _batch(self):
-        for i in range(0, len(self.data), self.batch_size):
-            yield (i, min(i + self.batch_size, len(self.data)))
+        return self.controller.ranges(len(self.data))
 
-    def process_job(self, data):
-        print('\n'.join(data))
-        # Build Payload and Header
-        payload = "------WebKitFormBoundary7MA4YWxkTrZu0gW\r\nContent-Disposition: form-data; name=\"text\"\r\n\r\n" + '\n'.join(data) + "\n------WebKitFormBoundary7MA4YWxkTrZu0gW--"
-        headers = {
-            'content-type': "multipart/form-data; boundary=----WebKitFormBoundary7MA4YWxkTrZu0gW",
-            'cache-control': "no-cache"
-        }
+    # Extract Results Table - Returns None if Server Produced No Result Table
+    def _parse_result(self, html, data):
+        soup = BeautifulSoup(html, features="html5lib")
+        if len(list(soup.find_all('tbody'))) == 1: return None
+        table = list(soup.find_all('tbody')[1])[1:]
 
+        # Format Result
+        col, amp, non_amp = LABELS[self.mode]
+        ids = list(map(lambda x: x[1:], data[::2]))
         out = []
-        try:
-            # Submit POST Request - Return JobID
-            req = requests.post(ACTION_URL, data=payload, headers=headers)
-
-            # Extract Results Table
-            soup = BeautifulSoup(req.text, features="html5lib")
-            if len(list(soup.find_all('tbody'))) == 1: return None
-            table = list(soup.find_all('tbody')[1])[1:]
-
-            # Format Result
-            ids = list(map(lambda x: x[1:], data[::2]))
-            print(ids)
-            for t in table:
-                row = [i.text for i in t.find_all('td')]
-                if row[0] not in ids: continue
-                if row[3] == 'AMP': out.append([row[0], 1, 1.0])
-                elif row[3] == 'Non AMP': out.append([row[0], 0, 0.0])
+        for t in table:
+            if not hasattr(t, 'find_all'): continue
+            row = [i.text for i in t.find_all('td')]
+            if len(row) <= col or row[0] not in ids: continue
+            if row[col] == amp: out.append([row[0], 1, 1.0])
+            elif row[col] == non_amp: out.append([row[0], 0, 0.0])
+        return out  # [PepID, Label, Prob]
 
+    def process_job(self, data):
+        if self.transport == 'selenium': return self._process_job(data)
+
+        try:
+            # Submit Multipart POST Request over Pooled Session
+            with get_host(ROOT_URL).slot():
+                req = self.session.post(self.action_url, files={'text' : (None, '\n'.join(data))},
+                                        headers={'cache-control' : 'no-cache'}, timeout=TIMEOUT)
+            req.raise_for_status()
+            return self._parse_result(req.text, data)
+        except HostUnavailable: raise
         except Exception as e:
             print(e)
 
-        return out  # [PepID, Label, Prob]
+    # Shared Browser Pool
+    def _pool(self):
+        return get_pool(self.form_url, size=self.workers, headless=False, ready=(By.NAME, 'text'))
 
     def _process_job(self, data):
-        # Initialize Selenium Web Driver
-        chrome_options = Options()
-        chrome_options.add_argument("--headless")
-        # driver = webdriver.Chrome(chrome_options=chrome_options)
-        driver = webdriver.Chrome()
-        driver.get(FORM_URL)
-
-        out = []
         try:
-            # Locate Web Elements
-            textarea =  driver.find_element_by_name('text')
-            submit = driver.find_element_by_name('B1')
-
-            # Populate Form
-            textarea.send_keys('\n'.join(data))
+            with get_host(ROOT_URL).slot(), self._pool().driver() as driver:
+                # Locate Web Elements
+                textarea =  driver.find_element_by_name('text')
+                submit = driver.find_element_by_name('B1')
 
-            submit.click()  # Submit Form
+                # Populate Form
+                textarea.send_keys('\n'.join(data))
 
-            # Extract Results Table
-            soup = BeautifulSoup(driver.page_source, features="html5lib")
-            if len(list(soup.find_all('tbody'))) == 1: return None
-            table = list(soup.find_all('tbody')[1])[1:]
+                submit.click()  # Submit Form
 
-            # Format Result
-            ids = list(map(lambda x: x[1:], data[::2]))
-            for t in table:
-                row = [i.text for i in t.find_all('td')]
-                if row[0] not in ids: continue
-                if row[4] == 'Antimicrobial Peptide': out.append([row[0], 1, 1.0])
-                elif row[4] == 'NON-Antimicrobial Peptide': out.append([row[0], 0, 0.0])
+                return self._parse_result(driver.page_source, data)
 
+        except HostUnavailable: raise
         except Exception as e:
             print(e)
-            time.sleep(15)
-        finally:
-             driver.close()
-
-        return out
-
-    def _binf(self, data):
-        res = self._process_job(data)
-        if len(data) == 2 and res == None: return []
-        if res != None: return res
-        mid = int(len(data)/2) + 1 if int(len(data)/2) % 2 != 0 else int(len(data)/2)
-        return self._binf(data[:mid]) + self._binf(data[mid:])
 
     # Prediction Function
-    # TODO: Add sleep function so we won't overwhelm the server
     def predict(self):
-        results = []
-        for i, (st, ed) in enumerate(self._batch()):
-            print('> PROCESSING BATCH #' + str(i))
-
-            # Process Batch Job (Use Binary Filter for Robust Error-Handling Process)
-            res = self._binf(self.data[st:ed])
-            res_id = [i[0] for i in res]
+        results = self._cache_lookup()
+        for res in run_batches(self._batch(), self._run_batch, self.workers): results += res
+        return results
 
-            # Impute Unavailable Results (with -999)
-            for id in self.data[st:ed][::2]:
-                if id[1:] not in res_id: res.append([id[1:], -999, -999])
+    # Single Batch Worker
+    def _run_batch(self, i, st, ed):
+        print('> PROCESSING BATCH #' + str(i))
 
-            results += res
-            time.sleep(self.sleep)  # Sleep to Avoid Overwhelming Server
+        # Process Batch Job (Isolate Failing Records for Robust Error-Handling Process)
+        res = self.isolator.run(self.data[st:ed])
+        res_id = [i[0] for i in res]
 
-        return results
+        # Impute Unavailable Results (with -999)
+        for id in self.data[st:ed][::2]:
+            if id[1:] not in res_id: res.append([id[1:], -999, -999])
 
-def read_fasta(data_dir):
-    return open(data_dir, 'r').read().split('\n')[:-1]
+        self._complete(self.data[st:ed], res)
+        return res
 
-# Unit Testing
+# Unit Testing (Run from src/ as Package Module: python -m server.ADAM)
 if __name__ == '__main__':
     # Application Parameters
-    DATA_DIR = '../../data/fasta/data.fasta.txt'
+    DATA_DIR = '../data/fasta/data.fasta.txt'
 
     # Load FASTA Dataset
     data = read_fasta(DATA_DIR)
@@ -6,31 +6,64 @@ from __future__ import print_function
 import sys
 import math
 import time
+import asyncio
+import aiohttp
 import requests
 from bs4 import BeautifulSoup
 
+from server.poller import Backoff, JobPoller
+from server.hosts import get_host, HostUnavailable
+from util.fasta import read_fasta
+from server.isolate import FaultIsolator, AsyncFaultIsolator
+from server.batching import BatchController
+
 # Application URL Parameters
 ROOT_URL = 'http://tcoffee.crg.cat/apps/ampa/'
 ACTION_URL = ROOT_URL + 'do:ampa'
 STATUS_URL = ROOT_URL + 'status'
 RESULT_URL = 'http://tcoffee.crg.cat/data/'
+TIMEOUT = 60    # Seconds per request before host counts as unreachable
 
 class AMPA(object):
-    def __init__(self, fasta_data, batch_size=50, window=7, threshold=0.225, status_time=5, sleep=2):
+    def __init__(self, fasta_data, batch_size=50, window=7, threshold=0.225, status_time=5, cache=None, on_batch=None,
+                 split=4, controller=None):
         # Class Parameters
         self.data = fasta_data
+        self.cache = cache
+        self.on_batch = on_batch    # Callback receiving each completed batch
         self.batch_size = batch_size * 2
         self.status_time = status_time
-        self.sleep = sleep
+
+        # Batch Size Controller (Fixed batch_size Unless Adaptive Controller Given)
+        self.controller = controller if controller is not None else BatchController(size=batch_size, adaptive=False)
+
+        # Status Polling (Adaptive Backoff from status_time)
+        self.backoff = Backoff(base=status_time)
+        self.polls = {}
 
         # Server Parameters
         self.window = window
         self.threshold = threshold
 
+        # Failed Batches are Split k Ways to Isolate Offending Records
+        self.split = split
+        self.isolator = FaultIsolator(self.process_job, k=split, on_submit=self.controller.observe)
+
+    # Prediction Cache Lookup - Drops Cached Records from Submission
+    def _cache_lookup(self):
+        if self.cache is None: return []
+        hits, self.data = self.cache.lookup('AMPA', '', {'window' : self.window, 'threshold' : self.threshold}, self.data)
+        if self.on_batch is not None: self.on_batch(hits)
+        return hits
+
+    # Batch Completion - Store in Cache and Notify Callback
+    def _complete(self, data, res):
+        if self.cache is not None: self.cache.store('AMPA', '', {'window' : self.window, 'threshold' : self.threshold}, data, res)
+        if self.on_batch is not None: self.on_batch(res)
+
     # Server accepts at most 50, batch data into chunks via generator func.
     def _batch(self):
-        for i in range(0, len(self.data), self.batch_size):
-             yield (i, min(i + self.batch_size, len(self.data)))
+        return self.controller.ranges(len(self.data))
 
     # Extract JobID from Page
     def _extJID(self, html):
@@ -39,12 +72,14 @@ class AMPA(object):
 
     # Extract Job Status
     def _checkJobStatus(self, job_id):
-        req = requests.get(STATUS_URL+'?rid='+job_id)
+        with get_host(ROOT_URL).slot():
+            req = requests.get(STATUS_URL+'?rid='+job_id, timeout=TIMEOUT)
         return req.text
 
     # Extract CSV Tabular Results
     def _getResult(self, job_id):
-        req = requests.get(RESULT_URL + job_id + '/data.csv')
+        with get_host(RESULT_URL).slot():
+            req = requests.get(RESULT_URL + job_id + '/data.csv', timeout=TIMEOUT)
         return req.text
 
     # Parse CSV String
@@ -52,70 +87,79 @@ class AMPA(object):
         raw = data.split('\n')[:-1]
         return [r.split(',') for r in raw]
 
-    # Single Job Submission Function
-    def process_job(self, data):
-        # Build Payload
-        body_data = {
+    # Format Result CSV to [PepID, Label, Prob]
+    def _format_result(self, data, csv):
+        # Note: Result set only provides positive examples.
+        result = self._parse_csv(csv)
+
+        pos_res = {}
+        for r in result:
+            if r[0] in pos_res:
+                if pos_res[r[0]] > 1 - (float(r[5][:-1]) / 100):
+                    r[0] = 1 - (float(r[5][:-1]) / 100)
+            else:
+                pos_res[r[0]] = 1 - (float(r[5][:-1]) / 100)
+
+        # Aggregate Results
+        res = []
+        for id in data[::2]:
+            label = 1 if id[1:] in pos_res else 0
+            prob = pos_res[id[1:]] if id[1:] in pos_res else 0.0
+            res.append([id[1:], label, prob])
+        return res # [PepID, Label, Prob]
+
+    # Build Job Payload
+    def _payload(self, data):
+        return {
             'protein' : '\n'.join(data),
             'window' : self.window,
             'threshold' : self.threshold
         }
 
+    # Single Job Submission Function
+    def process_job(self, data):
+        body_data = self._payload(data)
+
         try:
             # Submit POST Request - Return JobID
-            req = requests.post(ACTION_URL, params=body_data)
+            with get_host(ROOT_URL).slot():
+                req = requests.post(ACTION_URL, params=body_data, timeout=TIMEOUT)
             job_id = self._extJID(req.text)
 
             print('> PROCESSING JOB: ' + job_id)
 
-            # Check Job Status
-            while self._checkJobStatus(job_id) == 'Running':
-                time.sleep(self.status_time)  # Wait 10 Seconds
-                if self._checkJobStatus(job_id) == 'Done' or self._checkJobStatus(job_id) == 'Failed':
-                    break
+            # Check Job Status (One Call per Poll)
+            start = time.time()
+            wait, delay = self.backoff.first_delay(), self.backoff.base
+            self.polls[job_id] = 0
+            while True:
+                time.sleep(self.backoff.jitter(wait))
+                status = self._checkJobStatus(job_id)
+                self.polls[job_id] += 1
+                if status != 'Running': break
+                delay = self.backoff.next_delay(delay)
+                wait = delay
 
             # Obtain Prediction Results
-            if self._checkJobStatus(job_id) == 'Done':
-                # Note: Result set only provides positive examples.
-                result = self._parse_csv(self._getResult(job_id))
-
-                pos_res = {}
-                for r in result:
-                    if r[0] in pos_res:
-                        if pos_res[r[0]] > 1 - (float(r[5][:-1]) / 100):
-                            r[0] = 1 - (float(r[5][:-1]) / 100)
-                    else:
-                        pos_res[r[0]] = 1 - (float(r[5][:-1]) / 100)
-
-                # Aggregate Results
-                res = []
-                for id in data[::2]:
-                    label = 1 if id[1:] in pos_res else 0
-                    prob = pos_res[id[1:]] if id[1:] in pos_res else 0.0
-                    res.append([id[1:], label, prob])
-                return res # [PepID, Label, Prob]
+            if status == 'Done':
+                self.backoff.observe(time.time() - start)
+                return self._format_result(data, self._getResult(job_id))
 
             # TODO: Throw exception here if it fails!
             # if self._checkJobStatus(job_id) == 'Failed':
             #    print('>> SUBMISSION FAILED!')
 
             return None
+        except HostUnavailable: raise
         except Exception as e:
             print(e)
 
-    def _binf(self, data):
-        res = self.process_job(data)
-        if len(data) == 2 and res == None: return []
-        if res != None: return res
-        mid = int(len(data)/2) + 1 if int(len(data)/2) % 2 != 0 else int(len(data)/2)
-        return self._binf(data[:mid]) + self._binf(data[mid:])
-
     # Prediction Function
     def predict(self):
-        results = []
+        results = self._cache_lookup()
         for st, ed in self._batch():
-            # Process Batch Job (Use Binary Filter for Robust Error-Handling Process)
-            res = self._binf(self.data[st:ed])
+            # Process Batch Job (Isolate Failing Records for Robust Error-Handling Process)
+            res = self.isolator.run(self.data[st:ed])
             res_id = [i[0] for i in res]
 
             # Impute Unavailable Results (with -999)
@@ -123,16 +167,146 @@ class AMPA(object):
                 if id[1:] not in res_id: res.append([id[1:], -999, -999])
 
             results += res          # Append to Final Result Set
-            time.sleep(self.sleep)  # Sleep to Avoid Overwhelming Server
+            self._complete(self.data[st:ed], res)
+    
+        print('> STATUS POLLS: ' + str(sum(self.polls.values())) + ' FOR ' + str(len(self.polls)) + ' JOBS')
         return results
 
-def read_fasta(data_dir):
-    return open(data_dir, 'r').read().split('\n')[:-1]
+class AsyncAMPA(AMPA):
+    def __init__(self, fasta_data, batch_size=50, window=7, threshold=0.225, status_time=5, cache=None,
+                 on_batch=None, split=4, controller=None, max_jobs=4, host_limit=None, hedge=None, hedge_budget=0.1):
+        super(AsyncAMPA, self).__init__(fasta_data, batch_size=batch_size, window=window, threshold=threshold,
+                                        status_time=status_time, cache=cache, on_batch=on_batch,
+                                        split=split, controller=controller)
+        # Concurrency Parameters
+        self.max_jobs = max_jobs    # Jobs in flight at once
+        self.host_limit = host_limit if host_limit is not None else get_host(ROOT_URL).concurrency  # Connections per host
+
+        # Hedging Parameters (Duplicate Job Once Past hedge Percentile of Recent Job Durations)
+        self.hedge = hedge                  # None to disable
+        self.hedge_budget = hedge_budget    # Maximum hedged fraction of submitted jobs
+        self.submitted = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    # Submit Job - Return JobID
+    async def _submit(self, session, data):
+        params = {k : str(v) for k, v in self._payload(data).items()}
+        async with get_host(ROOT_URL).aslot(), session.post(ACTION_URL, params=params) as req:
+            return self._extJID(await req.text())
+
+    async def _checkJobStatus(self, session, job_id):
+        async with get_host(ROOT_URL).aslot(), session.get(STATUS_URL, params={'rid' : job_id}) as req:
+            return await req.text()
+
+    async def _getResult(self, session, job_id):
+        async with get_host(RESULT_URL).aslot(), session.get(RESULT_URL + job_id + '/data.csv') as req:
+            return await req.text()
+
+    # Single Job Submission Function (Holds Job Slot Until Result - Isolator Sub-Batches Included)
+    async def process_job(self, session, data):
+        try:
+            async with self.jobs:
+                job_id = await self._submit(session, data)
+                self.submitted += 1
+                print('> PROCESSING JOB: ' + job_id)
+
+                # Wait on Shared Poller (Result CSV Fetched Once Job is Done)
+                csv = await self._hedged(session, data, job_id)
+            if csv is not None: return self._format_result(data, csv)
+            return None
+        except HostUnavailable: raise
+        except Exception as e:
+            print(e)
+
+    # Wait for Job - Submits Duplicate if Job Runs Past Learned Latency Percentile
+    async def _hedged(self, session, data, job_id):
+        primary = self.poller.watch(job_id)
+        delay = self.backoff.percentile(self.hedge) if self.hedge is not None else None
+        if delay is None: return await primary
+
+        try:
+            return await asyncio.wait_for(asyncio.shield(primary), delay)
+        except asyncio.TimeoutError:
+            pass
+        if self.hedges >= self.hedge_budget * self.submitted: return await primary
+
+        # Hedge Only Takes a Free Job Slot (Never Exceeds max_jobs in Flight)
+        if self.jobs.locked(): return await primary
+        async with self.jobs:
+            # Submit Hedge - First Job to Produce a Result Wins, Loser is Ignored
+            self.hedges += 1
+            try:
+                hedge_id = await self._submit(session, data)
+            except Exception as e:
+                print(e)
+                return await primary
+            print('>> HEDGING JOB: ' + job_id + ' WITH ' + hedge_id)
+
+            jobs = {job_id : primary, hedge_id : self.poller.watch(hedge_id)}
+            while len(jobs) > 0:
+                done, _ = await asyncio.wait(list(jobs.values()), return_when=asyncio.FIRST_COMPLETED)
+                for k in [k for k, f in jobs.items() if f in done]:
+                    csv = jobs.pop(k).result()
+                    if csv is None: continue
+                    for other in jobs: self.poller.forget(other)
+                    if k == hedge_id: self.hedge_wins += 1
+                    return csv
+        return None
+
+    async def _run_batch(self, session, slots, st, ed):
+        try:
+            res = await self.isolator.run(self.data[st:ed])
+            res_id = [i[0] for i in res]
+
+            # Impute Unavailable Results (with -999)
+            for id in self.data[st:ed][::2]:
+                if id[1:] not in res_id: res.append([id[1:], -999, -999])
+
+            self._complete(self.data[st:ed], res)
+            return res
+        finally:
+            slots.release()
+
+    async def _predict(self):
+        # Pooled Keep-Alive Connections Capped per Host
+        connector = aiohttp.TCPConnector(limit_per_host=self.host_limit)
+        self.jobs = asyncio.Semaphore(self.max_jobs)    # Jobs in flight on server
+        slots = asyncio.Semaphore(self.max_jobs)        # Top-level batches in progress
+        async with aiohttp.ClientSession(connector=connector) as session:
+            self.poller = JobPoller(lambda job_id: self._checkJobStatus(session, job_id),
+                                    lambda job_id: self._getResult(session, job_id),
+                                    backoff=self.backoff)
+            self.isolator = AsyncFaultIsolator(lambda data: self.process_job(session, data), k=self.split,
+                                               on_submit=self.controller.observe)
+
+            # Next Batch Taken Only Once a Batch Slot Frees Up (Sized by Controller at That Point)
+            jobs = []
+            for st, ed in self._batch():
+                await slots.acquire()
+                jobs.append(asyncio.ensure_future(self._run_batch(session, slots, st, ed)))
+            batches = await asyncio.gather(*jobs)
+
+        self.polls = self.poller.polls
+        total, count = self.poller.stats()
+        print('> STATUS POLLS: ' + str(total) + ' FOR ' + str(count) + ' JOBS')
+        if self.hedge is not None:
+            print('> HEDGED JOBS: ' + str(self.hedges) + ' / ' + str(self.submitted) + ' (' + str(self.hedge_wins) + ' WON)')
+        return [r for b in batches for r in b]
+
+    # Prediction Function (Keeps max_jobs Jobs in Flight)
+    def predict(self):
+        hits = self._cache_lookup()
+        loop = asyncio.new_event_loop()
+        try:
+            return hits + loop.run_until_complete(self._predict())
+        finally:
+            loop.close()
 
-# Unit Testing
+# Unit Testing (Run from src/ as Package Module: python -m server.AMPA)
 if __name__ == '__main__':
     # Application Parameters
-    DATA_DIR = '../../data/fasta/data.fasta.txt'
+    DATA_DIR = '../data/fasta/data.fasta.txt'
 
     # Load FASTA Dataset
     data = read_fasta(DATA_DIR)
@@ -5,105 +5,226 @@ Author: Yuya Jeremy Ong (yjo5006@psu.edu)
 from __future__ import print_function
 import sys
 import time
-from selenium import webdriver
+import threading
+from bs4 import BeautifulSoup
 from selenium.webdriver.common.by import By
-from selenium.webdriver.common.keys import Keys
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
+
+try: from urllib.parse import urljoin
+except ImportError: from urlparse import urljoin
+
+from server.pool import get_pool
+from server.hosts import get_host, HostUnavailable
+from util.fasta import read_fasta
+from server.session import get_session
+from server.batching import BatchController, run_batches
 
 # Application Parameters
 ROOT_URL = 'http://www.camp.bicnirrh.res.in/predict/'
+TIMEOUT = 300   # Seconds per request before host counts as unreachable (Batch predictions run in request)
+
+# Algorithm Checkbox Order on Form
+MODES = ['SVM', 'RF', 'ANN', 'DA']
+
+# Discovered Form Fields (Shared by All Instances)
+_FORM = {}
+_FORM_LOCK = threading.Lock()
 
 class CAMPR3:
-    def __init__(self, fasta_data, mode='SVM', batch_size=50, sleep=5):
+    def __init__(self, fasta_data, mode='SVM', batch_size=50, workers=1, cache=None, on_batch=None,
+                 transport='selenium', controller=None):
         # Class Parameters
         self.data = fasta_data
+        self.cache = cache
+        self.on_batch = on_batch    # Callback receiving each completed batch (dict of callbacks per mode if multi-mode)
         self.batch_size = batch_size * 2
-        self.mode = mode    # SVM, RF, ANN, DA
-        self.sleep = sleep
+        self.mode = mode    # SVM, RF, ANN, DA - or list of modes fetched in one submission
+        self.workers = workers
+        self.transport = transport  # selenium or http (falls back to selenium on failure)
+
+        # Batch Size Controller (Fixed batch_size Unless Adaptive Controller Given)
+        self.controller = controller if controller is not None else BatchController(size=batch_size, adaptive=False)
+
+        # Multi-Mode Submissions Tick Several Algorithms at Once
+        self.multi = isinstance(mode, (list, tuple))
+        self.modes = [m for m in MODES if m in mode] if self.multi else [mode]
+
+        # Shared Browser Pool (All Modes Submit to Same Form - Browsers Launched Lazily)
+        self.pool = get_pool(ROOT_URL, size=workers, ready=(By.NAME, 'S1'))
+        self.session = get_session(ROOT_URL, size=workers)
 
     def _get_ids(self, data):
         return data[::2]
 
+    def _notify(self, mode, res):
+        if self.on_batch is None: return
+        if self.multi: self.on_batch[mode](res)
+        else: self.on_batch(res)
+
+    # Prediction Cache Lookup - Drops Records Cached for Every Mode from Submission
+    def _cache_lookup(self):
+        hits = {m : [] for m in self.modes}
+        if self.cache is None: return hits
+
+        pending = set()
+        for m in self.modes:
+            hits[m], misses = self.cache.lookup('CAMPR3', m, None, self.data)
+            pending.update(misses[::2])
+
+        # Records Missing in Any Mode are Resubmitted for All Modes
+        data = []
+        for i in range(0, len(self.data), 2):
+            if self.data[i] in pending: data += self.data[i:i+2]
+        self.data = data
+
+        for m in self.modes:
+            hits[m] = [h for h in hits[m] if '>' + h[0] not in pending]
+            self._notify(m, hits[m])
+        return hits
+
+    # Batch Completion - Store in Cache and Notify Callback
+    def _complete(self, data, res):
+        for m in self.modes:
+            if self.cache is not None: self.cache.store('CAMPR3', m, None, data, res[m])
+            self._notify(m, res[m])
+
     def _batch(self):
-        for i in range(0, len(self.data), self.batch_size):
-             yield (i, min(i + self.batch_size, len(self.data)))
+        return self.controller.ranges(len(self.data))
 
-    def process_job(self, data):
-        # Initialize Selenium Web Driver
-        chrome_options = Options()
-        chrome_options.add_argument("--headless")
-        driver = webdriver.Chrome(chrome_options=chrome_options)
-        driver.get(ROOT_URL)
+    # Parse Single Algorithm Result Table
+    def _parse_table(self, text, mode, data):
+        table = text.split('\n')
 
-        res = []
-        try:
-            # Locate Web Elements
-            textarea =  driver.find_element_by_name('S1')
-            cbs = driver.find_elements_by_name('algo[]')
-            submit = driver.find_element_by_name('B1')
+        # Check for warning signal for index errors.
+        if 'Warning' in table[1]: table = table[5:]
+        else: table = table[4:]
 
-            # Populate Form
-            textarea.send_keys('\n'.join(data))
-            if self.mode == 'SVM': cbs[0].click()
-            elif self.mode == 'RF': cbs[1].click()
-            elif self.mode == 'ANN': cbs[2].click()
-            elif self.mode == 'DA': cbs[3].click()
+        # Build Index Based Dictionary
+        if mode == 'ANN':
+            score_dict = {int(t.split(' ')[0]) : t.split(' ')[1] for t in table}
+        else:
+            score_dict = {int(t.split(' ')[0]) : [t.split(' ')[1], t.split(' ')[2]] for t in table}
 
-            submit.click()  # Submit Form
+        # Process Table Results
+        res = []
+        for i, id in enumerate(data[::2]):
+            if i+1 in score_dict:
+                if mode == 'ANN':
+                    label = 1 if score_dict[i+1] == 'AMP' else 0
+                    res.append([id[1:], label, float(label)])
+                else:
+                    label = 1 if score_dict[i+1][0] == 'AMP' else 0
+                    res.append([id[1:], label, float(score_dict[i+1][1])])
+            else:
+                res.append([id[1:], -999, -999])
+        return res
 
-            # Extract Results Table
-            res_tbl = driver.find_elements_by_tag_name('tbody')
-            table = res_tbl[3].text.split('\n')
+    # Discover Form Action and Field Values from Form Page
+    def _form(self):
+        with _FORM_LOCK:
+            if len(_FORM) == 0:
+                with get_host(ROOT_URL).slot():
+                    req = self.session.get(ROOT_URL, timeout=TIMEOUT)
+                soup = BeautifulSoup(req.text, features='html5lib')
+                form = soup.find('textarea', attrs={'name' : 'S1'}).find_parent('form')
+                _FORM['action'] = urljoin(ROOT_URL, form.get('action', ''))
+                _FORM['method'] = form.get('method', 'post').lower()
+                _FORM['algo'] = [cb.get('value', 'on') for cb in form.find_all('input', attrs={'name' : 'algo[]'})]
+                _FORM['submit'] = form.find('input', attrs={'name' : 'B1'}).get('value', '')
+            return _FORM
+
+    # Render Table Text as Selenium Would (Rows per Line, Cells Space Separated)
+    def _table_text(self, tbody):
+        rows = []
+        for tr in tbody.find_all('tr'):
+            cells = [c.get_text(' ', strip=True) for c in tr.find_all(['td', 'th'])]
+            rows.append(' '.join([c for c in cells if c != '']))
+        return '\n'.join(rows)
+
+    # Browserless Submission - Single Round Trip over Pooled Session
+    def _submit_http(self, data):
+        form = self._form()
+        payload = {
+            'S1' : '\n'.join(data),
+            'algo[]' : [form['algo'][MODES.index(m)] for m in self.modes],
+            'B1' : form['submit']
+        }
+
+        with get_host(ROOT_URL).slot():
+            if form['method'] == 'get': req = self.session.get(form['action'], params=payload, timeout=TIMEOUT)
+            else: req = self.session.post(form['action'], data=payload, timeout=TIMEOUT)
+        req.raise_for_status()
+
+        # Extract Results Tables (One per Ticked Algorithm, in Form Order)
+        res_tbl = BeautifulSoup(req.text, features='html5lib').find_all('tbody')
+        return {m : self._parse_table(self._table_text(res_tbl[3 + k]), m, data) for k, m in enumerate(self.modes)}
+
+    # Submit Batch - Returns {Mode : [PepID, Label, Prob]}
+    def _submit(self, data):
+        if self.transport == 'http':
+            try:
+                return self._submit_http(data)
+            except HostUnavailable: raise
+            except Exception as e:
+                print('>> HTTP TRANSPORT FAILED - FALLING BACK TO SELENIUM: ' + str(e))
+        return self._submit_selenium(data)
+
+    def _submit_selenium(self, data):
+        res = {m : [] for m in self.modes}
+        try:
+            with get_host(ROOT_URL).slot(), self.pool.driver() as driver:
+                # Locate Web Elements
+                textarea =  driver.find_element_by_name('S1')
+                cbs = driver.find_elements_by_name('algo[]')
+                submit = driver.find_element_by_name('B1')
 
-            # Check for warning signal for index errors.
-            if 'Warning' in table[1]: table = table[5:]
-            else: table = table[4:]
+                # Populate Form
+                textarea.send_keys('\n'.join(data))
+                for m in self.modes: cbs[MODES.index(m)].click()
 
+                submit.click()  # Submit Form
 
-            # Build Index Based Dictionary
-            if self.mode == 'ANN':
-                score_dict = {int(t.split(' ')[0]) : t.split(' ')[1] for t in table}
-            else:
-                score_dict = {int(t.split(' ')[0]) : [t.split(' ')[1], t.split(' ')[2]] for t in table}
-
-            # Process Table Results
-            for i, id in enumerate(data[::2]):
-                if i+1 in score_dict:
-                    if self.mode == 'ANN':
-                        label = 1 if score_dict[i+1] == 'AMP' else 0
-                        res.append([id[1:], label, float(label)])
-                    else:
-                        label = 1 if score_dict[i+1][0] == 'AMP' else 0
-                        res.append([id[1:], label, float(score_dict[i+1][1])])
-                else:
-                    res.append([id[1:], -999, -999])
+                # Extract Results Tables (One per Ticked Algorithm, in Form Order)
+                res_tbl = driver.find_elements_by_tag_name('tbody')
+                for k, m in enumerate(self.modes):
+                    res[m] = self._parse_table(res_tbl[3 + k].text, m, data)
 
+        except HostUnavailable: raise
         except Exception as e:
             print(e)
-            time.sleep(15)
-        finally:
-             driver.close()
 
         return res
 
-    # Prediction Function
-    def predict(self):
-        results = []
-        for i, (st, ed) in enumerate(self._batch()):
-            print('> PROCESSING BATCH #' + str(i))
-            results += self.process_job(self.data[st:ed])
-            time.sleep(self.sleep)
-        return results
+    def process_job(self, data):
+        res = self._submit(data)
+        return res if self.multi else res[self.mode]
 
-def read_fasta(data_dir):
-    return open(data_dir, 'r').read().split('\n')[:-1]
+    # Single Batch Worker
+    def _run_batch(self, i, st, ed):
+        print('> PROCESSING BATCH #' + str(i))
+        start = time.time()
+
+        # Host Failing Fast - Not a Load Signal for Batch Controller
+        try:
+            res = self._submit(self.data[st:ed])
+            self.controller.observe((ed - st) // 2, all(len(res[m]) > 0 for m in self.modes), time.time() - start)
+        except HostUnavailable as e:
+            print(e)
+            res = {m : [] for m in self.modes}
+        self._complete(self.data[st:ed], res)
+        return res
+
+    # Prediction Function (Batches Run in Parallel Across Browser Pool)
+    # Returns Result List - or {Mode : Result List} if Multi-Mode
+    def predict(self):
+        results = self._cache_lookup()
+        for res in run_batches(self._batch(), self._run_batch, self.workers):
+            for m in self.modes: results[m] += res[m]
+        return results if self.multi else results[self.mode]
 
-# Unit Testing
+# Unit Testing (Run from src/ as Package Module: python -m server.CAMPR3)
 if __name__ == '__main__':
     # Application Parameters
-    DATA_DIR = '../../data/fasta/data.fasta.txt'
+    DATA_DIR = '../data/fasta/data.fasta.txt'
 
     # Load FASTA Dataset
     data = read_fasta(DATA_DIR)
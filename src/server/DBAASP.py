@@ -3,99 +3,165 @@ DBAASP - Batch Prediction Routine
 Author: Yuya Jeremy Ong (jyo5006@psu.edu)
 '''
 from __future__ import print_function
-import time
-from selenium import webdriver
+from bs4 import BeautifulSoup
 from selenium.webdriver.common.by import By
-from selenium.webdriver.common.keys import Keys
-from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.common.action_chains import ActionChains
 from selenium.webdriver.support import expected_conditions as EC
 
+from server.pool import get_pool
+from server.hosts import get_host, HostUnavailable
+from util.fasta import read_fasta
+from server.session import get_session
+from server.isolate import FaultIsolator
+from server.batching import BatchController, run_batches
+
 # Application URL Parameters
 ROOT_URL = 'https://dbaasp.org/'
 FORM_URL = ROOT_URL + 'prediction'
 ACTION_URL = ROOT_URL + 'utility/general-prediction'
 
 class DBAASP:
-    def __init__(self, fasta_data, batch_size=50, wait=5, sleep=5):
+    def __init__(self, fasta_data, batch_size=50, wait=5, workers=1, cache=None, on_batch=None,
+                 transport='selenium', split=4, controller=None):
         # Class Parameters
         self.data = fasta_data
+        self.cache = cache
+        self.on_batch = on_batch    # Callback receiving each completed batch
         self.batch_size = batch_size * 2
         self.wait_time = wait
-        self.sleep = sleep
+        self.workers = workers
+        self.transport = transport  # selenium or http (falls back to selenium on failure)
+
+        # Batch Size Controller (Fixed batch_size Unless Adaptive Controller Given)
+        self.controller = controller if controller is not None else BatchController(size=batch_size, adaptive=False)
+
+        # Shared Browser Pool (Parked Until Form Rendered - Browsers Launched Lazily)
+        self.pool = get_pool(FORM_URL, size=workers, ready=(By.ID, 'data'))
+        self.session = get_session(ROOT_URL, size=workers)
+
+        # Failed Batches are Split k Ways to Isolate Offending Records
+        self.isolator = FaultIsolator(self.process_job, k=split, workers=workers, on_submit=self.controller.observe)
+
+    # Prediction Cache Lookup - Drops Cached Records from Submission
+    def _cache_lookup(self):
+        if self.cache is None: return []
+        hits, self.data = self.cache.lookup('DBAASP', '', None, self.data)
+        if self.on_batch is not None: self.on_batch(hits)
+        return hits
+
+    # Batch Completion - Store in Cache and Notify Callback
+    def _complete(self, data, res):
+        if self.cache is not None: self.cache.store('DBAASP', '', None, data, res)
+        if self.on_batch is not None: self.on_batch(res)
 
     def _batch(self):
-        for i in range(0, len(self.data), self.batch_size):
-             yield (i, min(i + self.batch_size, len(self.data)))
+        return self.controller.ranges(len(self.data))
 
-    def process_job(self, data):
-        # Initialize Selenium Web Driver
-        chrome_options = Options()
-        chrome_options.add_argument("--headless")
-        driver = webdriver.Chrome(chrome_options=chrome_options)
-        driver.get(FORM_URL)
+    # Process Result Lines ("<PepID> <Class> ...") to Defined Format
+    def _parse_lines(self, output):
+        res = []
+        for o in output:
+            r = o.split(' ')
+            if len(r) < 2: continue
+            if r[1] == 'AMP': res.append([r[0], 1, 1.0])
+            elif r[1] == 'Non-AMP': res.append([r[0], 0, 0.0])
+        return res
 
-        time.sleep(5)
+    # Flatten JSON Response to Result Lines (Any Object Holding a Batch PepID and Class,
+    # or Keyed by PepID) - Response Shape Not Yet Checked Against a Live Response
+    def _json_lines(self, node, ids):
+        if isinstance(node, list): return [l for n in node for l in self._json_lines(n, ids)]
+        if not isinstance(node, dict): return []
+
+        keyed = []
+        for k, v in node.items():
+            if str(k) not in ids: continue
+            inner = [str(x) for x in (v.values() if isinstance(v, dict) else [v]) if not isinstance(x, (list, dict))]
+            label = [x for x in inner if x in ('AMP', 'Non-AMP')]
+            if len(label) > 0: keyed.append(str(k) + ' ' + label[0])
+        if len(keyed) > 0: return keyed
+
+        values = [str(v) for v in node.values() if not isinstance(v, (list, dict))]
+        pid = [v for v in values if v in ids]
+        label = [v for v in values if v in ('AMP', 'Non-AMP')]
+        if len(pid) > 0 and len(label) > 0: return [pid[0] + ' ' + label[0]]
+        return self._json_lines(list(node.values()), ids)
+
+    # Browserless Submission - Post Batch Directly to Prediction Endpoint
+    def _process_http(self, data):
+        with get_host(ROOT_URL).slot():
+            req = self.session.post(ACTION_URL, data={'data' : '\n'.join(data)}, timeout=self.wait_time * 12)
+        req.raise_for_status()
+
+        ids = set([i[1:] for i in data[::2]])
+        try:
+            output = self._json_lines(req.json(), ids)
+        except ValueError:
+            soup = BeautifulSoup(req.text, features='html5lib')
+            output = [' '.join(c.get_text(strip=True) for c in tr.find_all('td')) for tr in soup.find_all('tr')]
+
+        # Response Must Cover Every Record of Batch (Page Shell, Error Page or Unknown Shape) - Else Transport Failure
+        res = [r for r in self._parse_lines(output) if r[0] in ids]
+        missing = ids - set(r[0] for r in res)
+        if len(missing) > 0: raise ValueError('HTTP RESPONSE MISSING ' + str(len(missing)) + ' OF ' + str(len(ids)) + ' RECORDS')
+        return res
 
+    def process_job(self, data):
+        print('>> IDs: ' + str([i[1:] for i in data[::2]]))
+        if self.transport == 'http':
+            try:
+                return self._process_http(data)
+            except HostUnavailable: raise
+            except Exception as e:
+                print('>> HTTP TRANSPORT FAILED - FALLING BACK TO SELENIUM: ' + str(e))
+        return self._process_selenium(data)
+
+    def _process_selenium(self, data):
         res = []
         try:
-            # Locate Web Elements
-            textarea = driver.find_element_by_id('data')
-            submit = driver.find_element_by_class_name('btn-primary')
-
-            textarea.send_keys('\n'.join(data)) # Populate Form
-            submit.click()                      # Submit Form
-
-            # Wait Until Table Populated
-            WebDriverWait(driver, self.wait_time).until(EC.presence_of_element_located((By.TAG_NAME, "th")))
-            res_table = driver.find_elements_by_tag_name('tbody')   # Extract Result Table
-
-            # Process Results to Defined Format
-            output = ' '.join([e.text for e in res_table]).split('\n')
-            for o in output:
-                if o.split(' ')[1] == 'AMP':
-                    res.append([o.split(' ')[0], 1, 1.0])
-                elif o.split(' ')[1] == 'Non-AMP':
-                    res.append([o.split(' ')[0], 0, 0.0])
+            with get_host(ROOT_URL).slot(), self.pool.driver() as driver:
+                # Locate Web Elements
+                textarea = driver.find_element_by_id('data')
+                submit = driver.find_element_by_class_name('btn-primary')
+
+                textarea.send_keys('\n'.join(data)) # Populate Form
+                submit.click()                      # Submit Form
+
+                # Wait Until Table Populated
+                WebDriverWait(driver, self.wait_time).until(EC.presence_of_element_located((By.TAG_NAME, "th")))
+                res_table = driver.find_elements_by_tag_name('tbody')   # Extract Result Table
+
+                # Process Results to Defined Format
+                res = self._parse_lines(' '.join([e.text for e in res_table]).split('\n'))
+        except HostUnavailable: raise
         except Exception as e:
             print(e)
-        finally:
-            driver.close()
 
         return res
 
-    def _binf(self, data):
-        data_id = [i[1:] for i in data[::2]]
-        print('>> IDs: ' + str(data_id))
-        res = self.process_job(data)
-        if len(data) == 2 and len(res) == 0: return []
-        if len(res) > 0: return res
+    # Single Batch Worker
+    def _run_batch(self, i, st, ed):
+        print('> PROCESSING BATCH #' + str(i))
+        res = self.isolator.run(self.data[st:ed])
+        res_id = [i[0] for i in res]
 
-        time.sleep(self.sleep)
-        mid = int(len(data)/2) + 1 if int(len(data)/2) % 2 != 0 else int(len(data)/2)
-        return self._binf(data[:mid]) + self._binf(data[mid:])
+        # Impute Unavailable Results (with -999)
+        for id in self.data[st:ed][::2]:
+            if id[1:] not in res_id: res.append([id[1:], -999, -999])
 
-    def predict(self):
-        results = []
-        for i, (st, ed) in enumerate(self._batch()):
-            print('> PROCESSING BATCH #' + str(i))
-            res = self._binf(self.data[st:ed])
-            res_id = [i[0] for i in res]
-
-            # Impute Unavailable Results (with -999)
-            for id in self.data[st:ed][::2]:
-                if id[1:] not in res_id: res.append([id[1:], -999, -999])
+        self._complete(self.data[st:ed], res)
+        return res
 
-            results += res
+    # Prediction Function (Batches Run in Parallel Across Browser Pool)
+    def predict(self):
+        results = self._cache_lookup()
+        for res in run_batches(self._batch(), self._run_batch, self.workers): results += res
         return results
 
-def read_fasta(data_dir):
-    return open(data_dir, 'r').read().split('\n')[:-1]
-
+# Unit Testing (Run from src/ as Package Module: python -m server.DBAASP)
 if __name__ == '__main__':
     # Application Parameters
-    DATA_DIR = '../../data/fasta/data.fasta.txt'
+    DATA_DIR = '../data/fasta/data.fasta.txt'
 
     # Load FASTA Dataset
     data = read_fasta(DATA_DIR)
@@ -0,0 +1,102 @@
+'''
+Adaptive Batch Sizing
+Per-server AIMD controller that grows the batch size while submissions succeed
+at a healthy latency and shrinks it when they fail. Learned sizes are
+persisted between runs.
+
+Author: Yuya Jeremy Ong (yjo5006@psu.edu)
+'''
+from __future__ import print_function
+import os
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Persisted Batch Sizes (Keyed by Server Name)
+_STATE = {'path' : None, 'sizes' : {}}
+_STATE_LOCK = threading.Lock()
+
+# Controller Registry (Keyed by Server Name)
+_CONTROLLERS = {}
+
+class BatchController(object):
+    def __init__(self, name=None, size=50, min_size=1, max_size=None, step=5, factor=0.5, tolerance=2.0, alpha=0.2,
+                 adaptive=True):
+        # Controller Parameters
+        self.name = name
+        self.size = size            # Records per batch
+        self.min_size = min_size
+        self.max_size = max_size    # None if unbounded
+        self.step = step            # Additive increase
+        self.factor = factor        # Multiplicative decrease
+        self.tolerance = tolerance  # Healthy if record latency within tolerance of its average
+        self.alpha = alpha
+        self.adaptive = adaptive
+
+        self.latency = None         # EWMA of seconds per record
+        self._lock = threading.Lock()
+
+    # Batch Index Ranges over FASTA Lines (Size Read as Each Batch is Taken)
+    def ranges(self, n):
+        i = 0
+        while i < n:
+            size = self.size * 2
+            yield (i, min(i + size, n))
+            i += size
+
+    # Record Submission Outcome - count Records, ok if Server Returned Results
+    def observe(self, count, ok, elapsed):
+        if not self.adaptive or count == 0: return
+        with self._lock:
+            size = self.size
+            rate = elapsed / count
+            healthy = self.latency is None or rate <= self.tolerance * self.latency
+
+            # Grow on Healthy Full Batches - Shrink on Failed Multi-Record Batches
+            if ok and healthy and count >= self.size: size = self.size + self.step
+            elif not ok and count > 1: size = int(self.size * self.factor)
+            if ok: self.latency = rate if self.latency is None else (1 - self.alpha) * self.latency + self.alpha * rate
+
+            size = max(self.min_size, size)
+            if self.max_size is not None: size = min(self.max_size, size)
+            if size == self.size: return
+            print('>> BATCH SIZE [' + str(self.name) + ']: ' + str(self.size) + ' -> ' + str(size))
+            self.size = size
+        _save(self.name, size)
+
+# Load Learned Batch Sizes (Subsequent Changes Written Back to Same File)
+def load_sizes(path):
+    with _STATE_LOCK:
+        _STATE['path'] = path
+        _STATE['sizes'] = json.load(open(path, 'r')) if os.path.exists(path) else {}
+
+def _save(name, size):
+    with _STATE_LOCK:
+        _STATE['sizes'][name] = size
+        if _STATE['path'] is None: return
+        if os.path.dirname(_STATE['path']) != '' and not os.path.exists(os.path.dirname(_STATE['path'])):
+            os.makedirs(os.path.dirname(_STATE['path']))
+        tmp = _STATE['path'] + '.tmp'
+        with open(tmp, 'w') as f: json.dump(_STATE['sizes'], f, indent=2, sort_keys=True)
+        os.replace(tmp, _STATE['path'])
+
+# Shared Controller per Server - Starts from Learned Size if Known
+def get_controller(name, size=50, max_size=None, **kw):
+    with _STATE_LOCK:
+        if name not in _CONTROLLERS:
+            size = _STATE['sizes'].get(name, size)
+            if max_size is not None: size = min(max_size, size)
+            _CONTROLLERS[name] = BatchController(name, size=size, max_size=max_size, **kw)
+        return _CONTROLLERS[name]
+
+# Run Batches over Worker Threads - Next Batch Taken Only Once a Worker Frees Up
+def run_batches(batches, fn, workers=1):
+    slots = threading.BoundedSemaphore(workers)
+    jobs = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for i, (st, ed) in enumerate(batches):
+            slots.acquire()
+            job = executor.submit(fn, i, st, ed)
+            job.add_done_callback(lambda _: slots.release())
+            jobs.append(job)
+        return [job.result() for job in jobs]
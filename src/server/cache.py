@@ -0,0 +1,100 @@
+'''
+Prediction Cache
+Persistent on-disk cache of server predictions keyed by (server, mode, server
+parameters, sequence hash) so re-runs only submit sequences not seen before.
+
+Author: Yuya Jeremy Ong (yjo5006@psu.edu)
+'''
+from __future__ import print_function
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+class PredictionCache(object):
+    def __init__(self, path, max_entries=1000000):
+        # Cache Parameters
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+        if os.path.dirname(path) != '' and not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('''CREATE TABLE IF NOT EXISTS predictions (
+                                server TEXT, mode TEXT, params TEXT, seq_hash TEXT,
+                                label INTEGER, prob REAL, used REAL,
+                                PRIMARY KEY (server, mode, params, seq_hash))''')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_used ON predictions (used)')
+        self._conn.commit()
+        self.size = self._conn.execute('SELECT COUNT(*) FROM predictions').fetchone()[0]
+
+    def _seq_hash(self, seq):
+        return hashlib.sha1(seq.encode('utf-8')).hexdigest()
+
+    def _params(self, params):
+        return json.dumps(params if params is not None else {}, sort_keys=True)
+
+    # Split FASTA Data into Cached Results and Records to Submit
+    def lookup(self, server, mode, params, data):
+        params = self._params(params)
+        hits, misses = [], []
+        with self._lock:
+            now = time.time()
+            for i in range(0, len(data), 2):
+                key = (server, mode, params, self._seq_hash(data[i+1]))
+                row = self._conn.execute('''SELECT label, prob FROM predictions
+                                            WHERE server=? AND mode=? AND params=? AND seq_hash=?''', key).fetchone()
+                if row is None:
+                    misses += data[i:i+2]
+                    continue
+                self._conn.execute('''UPDATE predictions SET used=?
+                                      WHERE server=? AND mode=? AND params=? AND seq_hash=?''', (now,) + key)
+                hits.append([data[i][1:], row[0], row[1]])
+            self._conn.commit()
+
+            self.hits += len(hits)
+            self.misses += len(misses) // 2
+        return hits, misses # [PepID, Label, Prob], FASTA
+
+    # Store Batch Results (Imputed -999 Records are Never Cached)
+    def store(self, server, mode, params, data, results):
+        params = self._params(params)
+        seqs = {data[i][1:] : data[i+1] for i in range(0, len(data), 2)}
+        rows = [(server, mode, params, self._seq_hash(seqs[r[0]]), r[1], r[2])
+                for r in results if r[1] != -999 and r[0] in seqs]
+        if len(rows) == 0: return
+
+        with self._lock:
+            now = time.time()
+            for r in rows:
+                new = self._conn.execute('''SELECT 1 FROM predictions
+                                            WHERE server=? AND mode=? AND params=? AND seq_hash=?''', r[:4]).fetchone() is None
+                self._conn.execute('INSERT OR REPLACE INTO predictions VALUES (?, ?, ?, ?, ?, ?, ?)', r + (now,))
+                if new: self.size += 1
+            self._evict()
+            self._conn.commit()
+
+    # Evict Least Recently Used Entries Beyond Size Bound
+    def _evict(self):
+        excess = self.size - self.max_entries
+        if excess <= 0: return
+        self._conn.execute('''DELETE FROM predictions WHERE rowid IN
+                              (SELECT rowid FROM predictions ORDER BY used LIMIT ?)''', (excess,))
+        self.size -= excess
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return float(self.hits) / total if total > 0 else 0.0
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+
+    def close(self):
+        with self._lock: self._conn.close()
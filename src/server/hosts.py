@@ -0,0 +1,195 @@
+'''
+Per-Host Request Budget
+Concurrency and politeness limits shared by every client talking to the same
+host (e.g. all four CAMPR3 modes share one budget). Requests are paced by a
+token bucket, and a circuit breaker holds them back while the host is
+unreachable, releasing them as soon as a health probe sees it recover.
+
+Author: Yuya Jeremy Ong (yjo5006@psu.edu)
+'''
+from __future__ import print_function
+import time
+import asyncio
+import weakref
+import threading
+import requests
+from contextlib import contextmanager
+
+try: from urllib.parse import urlparse
+except ImportError: from urlparse import urlparse
+
+try: from contextlib import asynccontextmanager
+except ImportError: asynccontextmanager = None
+
+# Errors Counted Against Host Health (Connection Failures and Timeouts)
+UNREACHABLE = (OSError, asyncio.TimeoutError)
+try:
+    import aiohttp
+    UNREACHABLE += (aiohttp.ClientConnectionError,)
+except ImportError: pass
+
+class HostUnavailable(Exception):
+    pass
+
+class Host(object):
+    def __init__(self, name, concurrency=1, delay=0, burst=1, url=None, failures=3, cooldown=5, max_cooldown=30,
+                 max_outage=600):
+        # Host Parameters
+        self.name = name
+        self.url = url if url is not None else 'http://' + name + '/'
+        self.concurrency = concurrency
+        self.delay = delay      # Average seconds between request starts (Token refill interval)
+        self.burst = burst      # Requests allowed back-to-back after idle
+
+        # Circuit Breaker Parameters
+        self.failures = failures            # Consecutive failures before opening
+        self.cooldown = cooldown            # Seconds before first health probe
+        self.max_cooldown = max_cooldown
+        self.max_outage = max_outage        # Seconds callers wait for recovery before failing fast
+
+        self._slots = threading.BoundedSemaphore(concurrency)
+        self._aslots = weakref.WeakKeyDictionary()   # Event loop -> asyncio.Semaphore
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+
+        # Token Bucket State
+        self._tokens = float(burst)
+        self._stamp = time.time()
+
+        # Breaker State
+        self._failed = 0
+        self._down = None       # Time circuit opened (None if closed)
+        self._probe_at = 0
+        self._wait = cooldown
+        self._probing = False
+
+    # Take Token - Returns Seconds to Wait Before Request May Start
+    def _reserve(self):
+        if self.delay <= 0: return 0
+        with self._lock:
+            now = time.time()
+            self._tokens = min(self.burst, self._tokens + (now - self._stamp) / self.delay)
+            self._stamp = now
+            self._tokens -= 1
+            return 0 if self._tokens >= 0 else -self._tokens * self.delay
+
+    # Health Probe - Any HTTP Response Means Host is Reachable
+    def probe(self):
+        try:
+            return requests.head(self.url, timeout=10, allow_redirects=True).status_code < 500
+        except Exception:
+            return False
+
+    # Block While Circuit is Open - Probes When Due, Fails Fast Once Outage Exceeds max_outage
+    # (Probes Keep Running on Schedule Past max_outage, so Host is Readmitted Once it Recovers)
+    def _admit(self):
+        with self._cond:
+            while self._down is not None:
+                now = time.time()
+                due = not self._probing and now >= self._probe_at
+                if not due and now - self._down > self.max_outage:
+                    raise HostUnavailable(self.name + ' UNREACHABLE FOR ' + str(int(now - self._down)) + 's')
+                if not due:
+                    self._cond.wait(max(0.1, min(self._probe_at - now, 1.0)))
+                    continue
+
+                # Run Health Probe (Other Callers Wait on Result)
+                self._probing = True
+                self._cond.release()
+                try: ok = self.probe()
+                finally: self._cond.acquire()
+                self._probing = False
+                if ok:
+                    print('>> HOST RECOVERED [' + self.name + '] AFTER ' + str(int(time.time() - self._down)) + 's')
+                    self._close()
+                else:
+                    self._wait = min(self.max_cooldown, self._wait * 2)
+                    self._probe_at = time.time() + self._wait
+                self._cond.notify_all()
+
+    def _close(self):
+        self._failed = 0
+        self._down = None
+        self._wait = self.cooldown
+
+    # Record Request Outcome (Opens Circuit After Consecutive Failures)
+    def record(self, ok):
+        with self._cond:
+            if ok:
+                if self._down is not None: self._cond.notify_all()
+                self._close()
+                return
+            self._failed += 1
+            if self._failed >= self.failures and self._down is None:
+                print('>> HOST DOWN [' + self.name + '] - HOLDING REQUESTS UNTIL HEALTH PROBE SUCCEEDS')
+                self._down = time.time()
+                self._probe_at = self._down + self._wait
+
+    # Acquire Request Slot (Blocks Until Circuit, Concurrency and Rate Allow)
+    @contextmanager
+    def slot(self):
+        self._admit()
+        with self._slots:
+            wait = self._reserve()
+            if wait > 0: time.sleep(wait)
+            try:
+                yield
+            except UNREACHABLE:
+                self.record(False)
+                raise
+            self.record(True)
+
+    # Concurrency Semaphore of Running Event Loop
+    def _async_slots(self):
+        loop = asyncio.get_event_loop()
+        with self._lock:
+            if loop not in self._aslots: self._aslots[loop] = asyncio.Semaphore(self.concurrency)
+            return self._aslots[loop]
+
+    # Acquire Request Slot from asyncio Code (Blocks Until Circuit, Concurrency and Rate Allow)
+    if asynccontextmanager is not None:
+        @asynccontextmanager
+        async def aslot(self):
+            await asyncio.get_event_loop().run_in_executor(None, self._admit)
+            async with self._async_slots():
+                wait = self._reserve()
+                if wait > 0: await asyncio.sleep(wait)
+                try:
+                    yield
+                except UNREACHABLE:
+                    self.record(False)
+                    raise
+                self.record(True)
+
+# Shared Host Registry (Keyed by Network Location)
+_HOSTS = {}
+_HOSTS_LOCK = threading.Lock()
+
+def host_name(url):
+    return urlparse(url).netloc if '//' in url else url
+
+def host_url(url):
+    if '//' not in url: return None
+    p = urlparse(url)
+    return p.scheme + '://' + p.netloc + '/'
+
+def get_host(url):
+    name = host_name(url)
+    with _HOSTS_LOCK:
+        if name not in _HOSTS: _HOSTS[name] = Host(name, url=host_url(url))
+        elif host_url(url) is not None: _HOSTS[name].url = host_url(url)
+        return _HOSTS[name]
+
+def configure(url, concurrency=1, delay=0, burst=1):
+    name = host_name(url)
+    with _HOSTS_LOCK:
+        _HOSTS[name] = Host(name, concurrency=concurrency, delay=delay, burst=burst, url=host_url(url))
+        return _HOSTS[name]
+
+# Load Host Limits from CSV (host,concurrency,delay[,burst])
+def load_hosts(path):
+    data = open(path, 'r').read().split('\n')[1:]
+    for d in data:
+        if d.strip() == '': continue
+        r = d.split(',')
+        configure(r[0], concurrency=int(r[1]), delay=float(r[2]), burst=int(r[3]) if len(r) > 3 and r[3] != '' else 1)
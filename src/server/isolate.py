@@ -0,0 +1,135 @@
+'''
+Batch Fault Isolation
+Isolates the records responsible for a failed batch by splitting it k ways and
+submitting sibling sub-batches concurrently. Sequence features seen to cause
+failures are learned, and records carrying them are sent apart from the batch in
+small batches of their own.
+
+Author: Yuya Jeremy Ong (yjo5006@psu.edu)
+'''
+from __future__ import print_function
+import math
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from server.hosts import HostUnavailable
+
+# Canonical Amino Acid Residues
+STANDARD = set('ACDEFGHIKLMNPQRSTVWY')
+
+class FaultIsolator(object):
+    def __init__(self, submit, k=4, workers=1, threshold=0.5, min_obs=3, on_submit=None, load_failure=0.5,
+                 risky_size=4):
+        # Isolation Parameters
+        self.submit = submit        # fn(data) -> results, None or [] if batch failed
+        self.k = k
+        self.workers = workers
+        self.threshold = threshold  # Failure rate at which a feature is isolated upfront
+        self.min_obs = min_obs
+        self.on_submit = on_submit  # fn(count, ok, elapsed) per top-level batch
+        self.load_failure = load_failure    # Unrecovered fraction at which a batch failure counts as server load
+        self.risky_size = risky_size        # Records per batch of learned-risky records
+
+        self.stats = {}             # Feature -> [failures, observations]
+        self.submissions = 0
+        self._lock = threading.Lock()
+
+    # Sequence Features Used to Predict Failure
+    def features(self, seq):
+        feats = ['len:' + str(min(len(seq) // 10, 10))]
+        if len(set(seq) - STANDARD) > 0: feats.append('nonstd')
+        return feats
+
+    def _observe(self, data, failed):
+        with self._lock:
+            for seq in data[1::2]:
+                for f in self.features(seq):
+                    if f not in self.stats: self.stats[f] = [0, 0]
+                    self.stats[f][0] += 1 if failed else 0
+                    self.stats[f][1] += 1
+
+    def risky(self, seq):
+        for f in self.features(seq):
+            fail, obs = self.stats.get(f, [0, 0])
+            if obs >= self.min_obs and float(fail) / obs >= self.threshold: return True
+        return False
+
+    # Split Records into Batch and Small Batches of Learned-Risky Records - Returns [(Batch, Top-Level)]
+    # (Risky Batches Expected to Fail, so Not Reported to Controller)
+    def _partition(self, data):
+        safe, risky = [], []
+        for i in range(0, len(data), 2):
+            if self.risky(data[i+1]): risky += data[i:i+2]
+            else: safe += data[i:i+2]
+        size = 2 * self.risky_size
+        return ([(safe, True)] if len(safe) > 0 else []) + [(risky[i:i+size], False) for i in range(0, len(risky), size)]
+
+    # Split Batch k Ways on Record Boundaries
+    def _split(self, data):
+        n = len(data) // 2
+        size = int(math.ceil(float(n) / min(self.k, n))) * 2
+        return [data[i:i+size] for i in range(0, len(data), size)]
+
+    def _record(self, data, res):
+        with self._lock: self.submissions += 1
+        if res: self._observe(data, False)
+        elif len(data) == 2: self._observe(data, True)
+
+    # Report Top-Level Batch Outcome - Failures Isolated to a Few Records are Not Load Signals
+    def _report(self, data, res, ok, elapsed):
+        if self.on_submit is None: return
+        n = len(data) // 2
+        if ok: self.on_submit(n, True, elapsed)
+        elif n - sum(1 for r in res if r[1] != -999) >= self.load_failure * n: self.on_submit(n, False, elapsed)
+
+    def _isolate(self, data, top=False):
+        # Host Failing Fast - Neither Split nor Reported to Controller
+        start = time.time()
+        try: res = self.submit(data)
+        except HostUnavailable as e:
+            print(e)
+            return []
+        elapsed = time.time() - start
+        self._record(data, res)
+        if res:
+            if top: self._report(data, res, True, elapsed)
+            return res
+        if len(data) == 2: return []
+
+        # Submit Sibling Sub-Batches Concurrently
+        parts = self._split(data)
+        if self.workers <= 1: res = [r for p in parts for r in self._isolate(p)]
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.workers, len(parts))) as executor:
+                res = [r for sub in executor.map(self._isolate, parts) for r in sub]
+        if top: self._report(data, res, False, elapsed)
+        return res
+
+    def run(self, data):
+        return [r for p, top in self._partition(data) for r in self._isolate(p, top)]
+
+class AsyncFaultIsolator(FaultIsolator):
+    async def _isolate(self, data, top=False):
+        # Host Failing Fast - Neither Split nor Reported to Controller
+        start = time.time()
+        try: res = await self.submit(data)
+        except HostUnavailable as e:
+            print(e)
+            return []
+        elapsed = time.time() - start
+        self._record(data, res)
+        if res:
+            if top: self._report(data, res, True, elapsed)
+            return res
+        if len(data) == 2: return []
+
+        # Submit Sibling Sub-Batches Concurrently
+        parts = await asyncio.gather(*[self._isolate(p) for p in self._split(data)])
+        res = [r for sub in parts for r in sub]
+        if top: self._report(data, res, False, elapsed)
+        return res
+
+    async def run(self, data):
+        parts = await asyncio.gather(*[self._isolate(p, top) for p, top in self._partition(data)])
+        return [r for res in parts for r in res]
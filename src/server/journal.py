@@ -0,0 +1,49 @@
+'''
+Result Journal
+Append-only, fsynced log of batch results so interrupted runs can resume
+without resubmitting completed records.
+
+Author: Yuya Jeremy Ong (yjo5006@psu.edu)
+'''
+from __future__ import print_function
+import os
+import threading
+
+class Journal(object):
+    def __init__(self, path, resume=False):
+        self.path = path
+        self.rows = {}
+        self._lock = threading.Lock()
+
+        # Replay Existing Journal (Ignoring Partially Written Final Line)
+        tail = ''
+        if resume and os.path.exists(path):
+            raw = open(path, 'r').read()
+            lines = raw.split('\n')
+            if not raw.endswith('\n'): tail = lines[-1]
+            for l in lines[:-1]:
+                r = l.split(',')
+                if len(r) == 3: self.rows[r[0]] = r
+
+        self._out = open(path, 'a' if resume else 'w')
+        if tail != '': self._out.write('\n')
+
+    # Check if PepID Already Completed
+    def __contains__(self, pid):
+        return pid in self.rows
+
+    # Append Batch Results and Flush to Disk
+    def append(self, res):
+        if len(res) == 0: return
+        with self._lock:
+            for r in res:
+                self._out.write(r[0] + ',' + str(r[1]) + ',' + str(r[2]) + '\n')
+                self.rows[r[0]] = r
+            self._out.flush()
+            os.fsync(self._out.fileno())
+
+    def results(self):
+        return list(self.rows.values())
+
+    def close(self):
+        self._out.close()
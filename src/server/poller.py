@@ -0,0 +1,122 @@
+'''
+Job Status Poller
+Single polling loop shared by all outstanding jobs of an asynchronous server,
+with jittered exponential backoff that learns typical job durations.
+
+Author: Yuya Jeremy Ong (yjo5006@psu.edu)
+'''
+from __future__ import print_function
+import random
+import asyncio
+from collections import deque
+
+class Backoff(object):
+    def __init__(self, base=5, factor=1.5, cap=60, alpha=0.2, window=50):
+        # Backoff Parameters
+        self.base = base
+        self.factor = factor
+        self.cap = cap
+        self.alpha = alpha      # EWMA smoothing for learned job duration
+        self.typical = None
+        self.recent = deque(maxlen=window)  # Recent job durations
+
+    # Delay Before First Poll (Skip Polls Jobs Typically Never Finish Within)
+    def first_delay(self):
+        if self.typical is None: return self.base
+        return max(self.base, 0.8 * self.typical)
+
+    def next_delay(self, delay):
+        return min(self.cap, delay * self.factor)
+
+    # Equal Jitter - Spread Polls of Jobs Submitted Together
+    def jitter(self, delay):
+        return delay / 2.0 + random.uniform(0, delay / 2.0)
+
+    # Update Learned Job Duration
+    def observe(self, duration):
+        self.recent.append(duration)
+        if self.typical is None: self.typical = duration
+        else: self.typical = self.alpha * duration + (1 - self.alpha) * self.typical
+
+    # Job Duration Percentile over Recent Jobs (None Until min_obs Jobs Seen)
+    def percentile(self, q, min_obs=5):
+        if len(self.recent) < min_obs: return None
+        durations = sorted(self.recent)
+        return durations[min(len(durations) - 1, int(q * len(durations)))]
+
+class JobPoller(object):
+    def __init__(self, status, fetch, backoff=None, timeout=3600):
+        # Poller Parameters
+        self.status = status    # Coroutine: job_id -> status string
+        self.fetch = fetch      # Coroutine: job_id -> result
+        self.backoff = backoff if backoff is not None else Backoff()
+        self.timeout = timeout
+
+        self.jobs = {}
+        self.polls = {}         # Status calls issued per job
+        self._task = None
+
+    # Register Job - Returns Future Resolved with Result (None if Failed)
+    def watch(self, job_id):
+        loop = asyncio.get_event_loop()
+        now = loop.time()
+        delay = self.backoff.first_delay()
+        self.jobs[job_id] = {
+            'future' : loop.create_future(),
+            'start' : now,
+            'due' : now + self.backoff.jitter(delay),
+            'delay' : self.backoff.base
+        }
+        self.polls[job_id] = 0
+
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+        return self.jobs[job_id]['future']
+
+    def _finish(self, job_id, result):
+        job = self.jobs.pop(job_id)
+        if not job['future'].done(): job['future'].set_result(result)
+
+    # Stop Polling Job (Result No Longer Needed)
+    def forget(self, job_id):
+        if job_id in self.jobs: self._finish(job_id, None)
+
+    async def _poll(self, job_id, job):
+        loop = asyncio.get_event_loop()
+        self.polls[job_id] += 1
+        try:
+            status = await self.status(job_id)
+        except Exception as e:
+            print(e)
+            status = None
+
+        now = loop.time()
+        if job_id not in self.jobs: return     # Forgotten While Polling
+        if status == 'Done':
+            # Fetch Result as Soon as Job Completes
+            self.backoff.observe(now - job['start'])
+            try: result = await self.fetch(job_id)
+            except Exception as e:
+                print(e)
+                result = None
+            if job_id in self.jobs: self._finish(job_id, result)
+        elif status == 'Failed' or now - job['start'] > self.timeout:
+            self._finish(job_id, None)
+        else:
+            job['delay'] = self.backoff.next_delay(job['delay'])
+            job['due'] = now + self.backoff.jitter(job['delay'])
+
+    # Polling Loop - One Status Call per Due Job per Tick
+    async def _run(self):
+        loop = asyncio.get_event_loop()
+        while len(self.jobs) > 0:
+            now = loop.time()
+            due = [(k, v) for k, v in self.jobs.items() if v['due'] <= now]
+            if len(due) > 0:
+                await asyncio.gather(*[self._poll(k, v) for k, v in due])
+            else:
+                await asyncio.sleep(min(1.0, min(v['due'] for v in self.jobs.values()) - now))
+
+    def stats(self):
+        total = sum(self.polls.values())
+        return total, len(self.polls)
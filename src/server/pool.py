@@ -0,0 +1,122 @@
+'''
+Selenium WebDriver Pool
+Keeps a set of warm headless Chrome instances parked on a server's form page so
+batches can be submitted without paying browser startup on every request.
+
+Author: Yuya Jeremy Ong (yjo5006@psu.edu)
+'''
+from __future__ import print_function
+import atexit
+import threading
+from contextlib import contextmanager
+
+try: import queue
+except ImportError: import Queue as queue
+
+from selenium import webdriver
+from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+
+class DriverPool(object):
+    def __init__(self, url, size=1, headless=True, ready=None, wait=10):
+        # Pool Parameters
+        self.url = url
+        self.size = size
+        self.headless = headless
+        self.ready = ready      # Locator (By, value) signalling the form is rendered
+        self.wait = wait
+
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._live = 0
+
+    # Launch New Browser Instance
+    def _launch(self):
+        chrome_options = Options()
+        if self.headless: chrome_options.add_argument("--headless")
+        return webdriver.Chrome(chrome_options=chrome_options)
+
+    # Reset Browser State and Park on Form Page
+    def _park(self, driver):
+        driver.delete_all_cookies()
+        driver.get(self.url)
+        if self.ready is not None:
+            WebDriverWait(driver, self.wait).until(EC.presence_of_element_located(self.ready))
+
+    # Shutdown Browser and Free Slot
+    def _discard(self, driver):
+        try: driver.quit()
+        except Exception: pass
+        with self._lock: self._live -= 1
+
+    def _acquire(self):
+        while True:
+            # Reuse Parked Browser if Available
+            try: return self._idle.get_nowait()
+            except queue.Empty: pass
+
+            # Launch New Browser if Pool Not Yet Full
+            with self._lock:
+                spawn = self._live < self.size
+                if spawn: self._live += 1
+            if spawn: break
+
+            # Wait for Checkin (Recheck Capacity in Case a Browser was Recycled)
+            try: return self._idle.get(timeout=1)
+            except queue.Empty: pass
+
+        try:
+            driver = self._launch()
+        except Exception:
+            with self._lock: self._live -= 1
+            raise
+
+        try:
+            self._park(driver)
+        except Exception:
+            self._discard(driver)
+            raise
+        return driver
+
+    def _release(self, driver):
+        try:
+            self._park(driver)
+        except Exception as e:
+            # Recycle Crashed Browser (Replacement Launched Lazily on Next Checkout)
+            print('>> RECYCLING BROWSER: ' + str(e).strip())
+            self._discard(driver)
+            return
+        self._idle.put(driver)
+
+    # Checkout Driver from Pool (Reset on Return, Recycled if Unresponsive)
+    @contextmanager
+    def driver(self):
+        driver = self._acquire()
+        try:
+            yield driver
+        finally:
+            self._release(driver)
+
+    def close(self):
+        while True:
+            try: driver = self._idle.get_nowait()
+            except queue.Empty: break
+            self._discard(driver)
+
+# Shared Pool Registry (Keyed by Form URL)
+_POOLS = {}
+_POOLS_LOCK = threading.Lock()
+
+def get_pool(url, size=1, **kwargs):
+    with _POOLS_LOCK:
+        if url not in _POOLS:
+            _POOLS[url] = DriverPool(url, size=size, **kwargs)
+        pool = _POOLS[url]
+        pool.size = max(pool.size, size)
+    return pool
+
+@atexit.register
+def close_all():
+    with _POOLS_LOCK:
+        for pool in _POOLS.values(): pool.close()
@@ -0,0 +1,63 @@
+'''
+Server Constraint Profiles
+Declarative per-server sequence constraints (length, alphabet, batch size) and a
+vectorized pre-flight check that keeps sequences a server rejects out of its batches.
+
+Author: Yuya Jeremy Ong (yjo5006@psu.edu)
+'''
+from __future__ import print_function
+import numpy as np
+
+# Canonical Amino Acid Residues
+STANDARD = 'ACDEFGHIKLMNPQRSTVWY'
+
+class Profile(object):
+    def __init__(self, name, min_len=1, max_len=None, alphabet=STANDARD, max_batch=None):
+        self.name = name
+        self.min_len = min_len
+        self.max_len = max_len      # None if unbounded
+        self.alphabet = alphabet
+        self.max_batch = max_batch  # None if unbounded
+
+        # Residue Lookup Table (Byte -> Allowed)
+        self.allowed = np.zeros(256, dtype=bool)
+        self.allowed[np.frombuffer(alphabet.encode('ascii'), dtype=np.uint8)] = True
+
+    # Validity Mask over FASTA Records
+    def check(self, data):
+        seqs = data[1::2]
+        lens = np.fromiter(map(len, seqs), dtype=np.int64, count=len(seqs))
+
+        # Count Disallowed Residues per Sequence over Concatenated Buffer
+        buf = np.frombuffer(''.join(seqs).upper().encode('ascii', 'replace'), dtype=np.uint8)
+        bad = np.concatenate([[0], np.cumsum(~self.allowed[buf])])
+        offsets = np.concatenate([[0], np.cumsum(lens)])
+        mask = bad[offsets[1:]] - bad[offsets[:-1]] == 0
+
+        mask &= lens >= self.min_len
+        if self.max_len is not None: mask &= lens <= self.max_len
+        return mask
+
+    # Split FASTA into Valid Records and Rejected PepIDs
+    def preflight(self, data):
+        mask = self.check(data)
+        valid = []
+        for i in np.flatnonzero(mask): valid += data[2*i:2*i+2]
+        rejected = [data[2*i][1:] for i in np.flatnonzero(~mask)]
+        return valid, rejected
+
+    def batch_size(self, batch_size):
+        return batch_size if self.max_batch is None else min(batch_size, self.max_batch)
+
+# Load Profiles from CSV (name,min_len,max_len,alphabet,max_batch - Blank if Unbounded)
+def load_profiles(path):
+    profiles = {}
+    data = open(path, 'r').read().split('\n')[1:]
+    for d in data:
+        if d.strip() == '': continue
+        r = d.split(',')
+        profiles[r[0]] = Profile(r[0], min_len=int(r[1]) if r[1] != '' else 1,
+                                 max_len=int(r[2]) if r[2] != '' else None,
+                                 alphabet=r[3] if r[3] != '' else STANDARD,
+                                 max_batch=int(r[4]) if r[4] != '' else None)
+    return profiles
@@ -0,0 +1,52 @@
+'''
+Server Job Scheduler
+Runs the batch queues of several model servers concurrently, reporting
+progress per server.
+
+Author: Yuya Jeremy Ong (yjo5006@psu.edu)
+'''
+from __future__ import print_function
+import time
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+class Scheduler(object):
+    def __init__(self):
+        self.tasks = []
+        self.total = {}
+        self.done = {}
+        self.elapsed = {}
+        self._lock = threading.Lock()
+
+    # Register Server Task - fn(progress) Runs the Server to Completion
+    def add(self, name, total, fn):
+        self.tasks.append((name, fn))
+        self.total[name] = total
+        self.done[name] = 0
+
+    # Progress Callback (Number of Records Completed)
+    def progress(self, name, count):
+        with self._lock:
+            self.done[name] += count
+            pct = 100.0 * self.done[name] / self.total[name] if self.total[name] > 0 else 100.0
+            print('> PROGRESS [' + name + ']: ' + str(self.done[name]) + ' / ' + str(self.total[name]) + ' ({:.1f}%)'.format(pct))
+
+    def _run_task(self, name, fn):
+        start = time.time()
+        try:
+            fn(lambda count: self.progress(name, count))
+        except Exception:
+            print('> FAILED [' + name + ']')
+            traceback.print_exc()
+        self.elapsed[name] = time.time() - start
+
+    def run(self):
+        start = time.time()
+        with ThreadPoolExecutor(max_workers=max(1, len(self.tasks))) as executor:
+            for job in [executor.submit(self._run_task, name, fn) for name, fn in self.tasks]: job.result()
+
+        # Report Wall Time per Server
+        for name, _ in self.tasks:
+            print('> FINISHED [' + name + ']: {:.1f}s'.format(self.elapsed[name]))
+        print('> TOTAL WALL TIME: {:.1f}s'.format(time.time() - start))
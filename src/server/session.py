@@ -0,0 +1,28 @@
+'''
+Pooled HTTP Sessions
+Shared keep-alive requests sessions for the browserless server transports.
+
+Author: Yuya Jeremy Ong (yjo5006@psu.edu)
+'''
+from __future__ import print_function
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+
+try: from urllib.parse import urlparse
+except ImportError: from urlparse import urlparse
+
+# Shared Session Registry (Keyed by Network Location)
+_SESSIONS = {}
+_SESSIONS_LOCK = threading.Lock()
+
+def get_session(url, size=1):
+    name = urlparse(url).netloc
+    with _SESSIONS_LOCK:
+        if name not in _SESSIONS or _SESSIONS[name][1] < size:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, size))
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _SESSIONS[name] = (session, size)
+        return _SESSIONS[name][0]
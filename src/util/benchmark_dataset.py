@@ -0,0 +1,132 @@
+'''
+AMP Dataset Generation Benchmark
+Times the original row-by-row dataset builder against the join-based builder in
+generate_dataset.py on the same server result files, and checks both write the
+same AMP_dataset.csv with the builder's default legacy sampler, then times the
+stratified samplers.
+
+Author: Yuya Jeremy Ong (yjo5006@psu.edu)
+'''
+from __future__ import print_function
+import time
+import random
+import argparse
+import warnings
+import numpy as np
+import pandas as pd
+import generate_dataset as gen
+from stratify import StratifiedSampler, STRATEGIES
+
+# Supress User Warnings
+warnings.filterwarnings('ignore')
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--root", type=str, default='../../data/out/data3.fasta.txt/', help="Folder of server result CSV files.")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of timed runs of the join-based builder.")
+    parser.add_argument("--candidates", type=int, default=1000000, help="Synthetic negatives per stratified sampler run.")
+    parser.add_argument("--skip_legacy", action='store_true', help="Only time the join-based builder.")
+    return parser.parse_args()
+
+# Original Builder (DataFrame.append Replaced with pd.concat) - Reads Every File Three Times
+def legacy(root):
+    random.seed(gen.SEED)
+    np.random.seed(gen.SEED)
+
+    data = {}
+    for s in gen.SERVERS:
+        raw = pd.read_csv(root + s + '.csv')
+        data[s] = {}
+        for d in gen.DATASET:
+            data[s][d] = {}
+            for r in gen.REVERSE:
+                data[s][d][r] = pd.DataFrame(raw[raw.PepID.str.contains(d)]
+                                                [raw.PepID.str.contains('R') == False]
+                                                [raw.AMPLabel == 1])
+                if r == 'R':
+                    data[s][d][r] = pd.concat([data[s][d][r], raw[raw.PepID.str.contains(d)]
+                                                                 [raw.PepID.str.contains('R') == True]
+                                                                 [raw.PepID.str.contains('R1') == False]
+                                                                 [raw.PepID.str.contains('R2') == False]
+                                                                 [raw.PepID.str.contains('R3') == False]])
+                elif r != '':
+                    data[s][d][r] = pd.concat([data[s][d][r], raw[raw.PepID.str.contains(d)]
+                                                                 [raw.PepID.str.contains(r)]])
+
+    orig_dist = {}
+    for s in gen.SERVERS:
+        raw = pd.read_csv(root + s + '.csv')
+        orig_dist[s] = {}
+        for d in gen.DATASET:
+            len_count = raw[raw.PepID.str.contains(d)][raw.PepID.str.contains('R') == False][raw.AMPLabel == 1]['PepSeq'].str.len()
+            orig_dist[s][d] = {}
+            for l in len_count:
+                if l not in orig_dist[s][d]:
+                    orig_dist[s][d][l] = 0
+                orig_dist[s][d][l] += 1
+
+    out_data = []
+    for s in gen.SERVERS:
+        raw = pd.read_csv(root + s + '.csv')
+        for d in gen.DATASET:
+            dat = raw[raw.PepID.str.contains(d)][raw.PepID.str.contains('R') == False][raw.AMPLabel == 0]
+            seq_len = dat['PepSeq'].astype(str).str.len()
+            for k in list(orig_dist[s][d]):
+                idx = seq_len[seq_len == k].index.values
+                idx_sel = np.random.choice(len(idx), orig_dist[s][d][k], replace=False)
+                data[s][d][''] = pd.concat([data[s][d][''], dat[dat.index.isin(idx[idx_sel])]])
+
+            for r in gen.REVERSE:
+                for id in data[s][d][r][['PepID', 'PepSeq', 'AMPLabel']].values.tolist():
+                    if id not in out_data: out_data.append(id)
+
+    out = []
+    for row in out_data:
+        o = [row[0][0], row[0], 'T' if len(row[0]) == 6 else row[0][6:], row[1], row[2]]
+        o += [-1.0 for i in range(len(gen.SERVERS))]
+        out.append(o)
+    out_df = pd.DataFrame(out, columns=['Database', 'PepID', 'PepType', 'PepSeq', 'PepLabel'] + gen.SERVERS)
+
+    for s in gen.SERVERS:
+        raw = pd.read_csv(root + s + '.csv')
+        for row in raw.values.tolist():
+            out_df.loc[out_df['PepID'] == row[0], s] = row[4]
+    return out_df
+
+# Join-Based Builder as Run by generate_dataset.py (Default Strategy and Seed)
+def joined(root):
+    return gen.build_dataset(gen.load_servers(root), sampler=gen.make_sampler(gen.parse_args([])))
+
+if __name__ == '__main__':
+    args = parse_args()
+
+    # Time Join-Based Builder (Best of N Runs)
+    times = []
+    for i in range(args.repeat):
+        start = time.time()
+        new_csv = joined(args.root).to_csv(index=False)
+        times.append(time.time() - start)
+    print('> JOIN BUILDER:\t\t{:.2f}s (best of {})'.format(min(times), args.repeat))
+
+    # Time Stratified Samplers on Synthetic Candidates (Positives Drawn from Candidates)
+    alphabet = np.frombuffer(b'ACDEFGHIKLMNPQRSTVWY', dtype=np.uint8)
+    rng = np.random.default_rng(gen.SEED)
+    lens = rng.integers(5, 60, args.candidates)
+    residues = alphabet[rng.integers(0, len(alphabet), lens.sum())].tobytes().decode('ascii')
+    ends = np.cumsum(lens)
+    neg = pd.Series([residues[e-l:e] for e, l in zip(ends, lens)])
+    pos = neg.iloc[rng.choice(len(neg), len(neg) // 20, replace=False)]
+    for strategy in STRATEGIES:
+        start = time.time()
+        picked = StratifiedSampler(strategy, seed=gen.SEED)(pos, neg)
+        print('> {} SAMPLER:\t{:.2f}s ({} of {} candidates)'.format(strategy.upper(), time.time() - start, len(picked), len(neg)))
+    if args.skip_legacy: exit()
+
+    # Time Original Builder
+    start = time.time()
+    old_csv = legacy(args.root).to_csv(index=False)
+    elapsed = time.time() - start
+    print('> LEGACY BUILDER:\t{:.2f}s'.format(elapsed))
+    print('> SPEEDUP:\t\t{:.1f}x'.format(elapsed / min(times)))
+    print('> IDENTICAL OUTPUT:\t' + str(old_csv == new_csv))
+    if old_csv != new_csv: exit(1)
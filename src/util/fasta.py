@@ -0,0 +1,133 @@
+'''
+Indexed FASTA Reader
+Memory-mapped FASTA file with a persistent offset index (<fasta>.fai.npy) and
+an on-disk PepID hash table (<fasta>.fai.hash.npy), giving O(1) lookup by PepID,
+record range slicing and lazy iteration without loading the file into memory.
+
+Author: Yuya Jeremy Ong (yjo5006@psu.edu)
+'''
+from __future__ import print_function
+import os
+import zlib
+import mmap
+import numpy as np
+
+# Record Table Layout (Header Offset, Sequence Offset, Sequence End Offset)
+RECORD = np.dtype([('head', '<i8'), ('seq', '<i8'), ('end', '<i8')])
+
+class Fasta(object):
+    def __init__(self, path, rebuild=False):
+        self.path = path
+        self.index_path = path + '.fai.npy'
+        self.hash_path = path + '.fai.hash.npy'
+
+        # Memory-Map FASTA File (Empty Files Cannot be Mapped)
+        self._file = open(path, 'rb')
+        size = os.path.getsize(path)
+        self.buf = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size > 0 else b''
+
+        # Load Persistent Index - Rebuilt if Missing or Older than FASTA File (Kept in Memory if Unwritable)
+        if rebuild or not self._fresh():
+            self.records, self.table = self._build()
+            try:
+                np.save(self.index_path, self.records)
+                np.save(self.hash_path, self.table)
+            except (IOError, OSError) as e:
+                print('>> FASTA INDEX NOT SAVED: ' + str(e))
+        else:
+            self.records = np.load(self.index_path, mmap_mode='r')
+            self.table = np.load(self.hash_path, mmap_mode='r')
+
+    def _fresh(self):
+        for p in [self.index_path, self.hash_path]:
+            if not os.path.exists(p) or os.path.getmtime(p) < os.path.getmtime(self.path): return False
+        return True
+
+    # Build Record Table and PepID Hash Table in One Pass over the Mapped File
+    def _build(self):
+        raw = np.frombuffer(self.buf, dtype=np.uint8) if len(self.buf) > 0 else np.zeros(0, dtype=np.uint8)
+        starts = np.concatenate([[0], np.flatnonzero(raw == ord('\n')) + 1])
+        starts = starts[starts < len(raw)]
+        heads = starts[raw[starts] == ord('>')] if len(starts) > 0 else starts
+
+        # Header Line Ends at Next Newline - Sequence Runs Until Next Header
+        nl = np.append(np.flatnonzero(raw == ord('\n')), len(raw))
+        head_end = nl[np.searchsorted(nl, heads)]
+        records = np.zeros(len(heads), dtype=RECORD)
+        records['head'] = heads
+        records['seq'] = np.minimum(head_end + 1, len(raw))
+        records['end'] = np.concatenate([heads[1:], [len(raw)]]) if len(heads) > 0 else heads
+
+        # Open Addressing Hash Table (Load Factor <= 0.5) - Slot Holds Record Index or -1
+        size = 1
+        while size < 2 * max(1, len(heads)): size *= 2
+        table = np.full(size, -1, dtype=np.int64)
+        hashes = np.array([zlib.crc32(self.buf[h+1:e].rstrip(b'\r')) for h, e in zip(heads, head_end)], dtype=np.int64)
+        pending = np.arange(len(heads))
+        slots = hashes & (size - 1)
+        while len(pending) > 0:
+            # Place First Claimant of Each Free Slot - Others Probe the Next Slot
+            free = table[slots] == -1
+            _, first = np.unique(slots[free], return_index=True)
+            placed = np.flatnonzero(free)[first]
+            table[slots[placed]] = pending[placed]
+            keep = np.ones(len(pending), dtype=bool)
+            keep[placed] = False
+            pending, slots = pending[keep], (slots[keep] + 1) & (size - 1)
+
+        return records, table
+
+    def __len__(self):
+        return len(self.records)
+
+    def id(self, i):
+        r = self.records[i]
+        return self.buf[r['head']+1:r['seq']].decode('ascii').rstrip('\r\n')
+
+    def seq(self, i):
+        r = self.records[i]
+        return self.buf[r['seq']:r['end']].decode('ascii').replace('\r', '').replace('\n', '')
+
+    def __getitem__(self, i):
+        return self.id(i), self.seq(i)
+
+    # Record Index of PepID (None if Absent)
+    def find(self, pid):
+        key = pid.encode('ascii')
+        size = len(self.table)
+        slot = zlib.crc32(key) & (size - 1)
+        while self.table[slot] != -1:
+            if self.id(self.table[slot]) == pid: return int(self.table[slot])
+            slot = (slot + 1) & (size - 1)
+        return None
+
+    def __contains__(self, pid):
+        return self.find(pid) is not None
+
+    # Lazy Iteration over (PepID, Sequence) for Records [st, ed)
+    def iter(self, st=0, ed=None):
+        ed = len(self) if ed is None else min(ed, len(self))
+        for i in range(st, ed): yield self[i]
+
+    def __iter__(self):
+        return self.iter()
+
+    def ids(self, st=0, ed=None):
+        ed = len(self) if ed is None else min(ed, len(self))
+        for i in range(st, ed): yield self.id(i)
+
+    # FASTA Lines for Records [st, ed) (Format Accepted by Server Classes)
+    def lines(self, st=0, ed=None):
+        out = []
+        for pid, seq in self.iter(st, ed): out += ['>' + pid, seq]
+        return out
+
+    def close(self):
+        if len(self.buf) > 0: self.buf.close()
+        self._file.close()
+
+def read_fasta(data_dir):
+    fasta = Fasta(data_dir)
+    data = fasta.lines()
+    fasta.close()
+    return data
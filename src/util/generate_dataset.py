@@ -1,26 +1,46 @@
 '''
 AMP Dataset Generation
+Builds the PepID x server prediction table with hash joins, reading every
+server result file once.
+
 Author: Yuya Jeremy Ong (yuyajong@ibm.com)
 '''
 from __future__ import print_function
-import random
+import argparse
 import warnings
 import numpy as np
 import pandas as pd
+from stratify import StratifiedSampler, STRATEGIES
+from peptides import PeptideTable
+from store import ResultStore
 
 # Supress User Warnings
 warnings.filterwarnings('ignore')
 
 # Application Parameters
 DATA_ROOT = '../data/out/data3.fasta.txt/'
+OUT_DIR = '../data/AMP_dataset.csv'
 SERVERS = ['ADAM_HMM', 'ADAM_SVM', 'AMPA', 'CMPR3_ANN', 'CMPR3_DA', 'CMPR3_RF', 'CMPR3_SVM', 'DBAASP']
 DATASET = ['A', 'D']
 REVERSE = ['', 'R', 'R1', 'R2', 'R3']
 SEED = 9892 # SEED for PRNG
 
-# Initialize PRNG
-random.seed(SEED)
-np.random.seed(SEED)
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--root", type=str, default=DATA_ROOT, help="Folder of server result CSV files.")
+    parser.add_argument("--store", type=str, help="Result store to read predictions from instead of --root.")
+    parser.add_argument("--dataset", type=str, default='data3.fasta.txt', help="Dataset name in result store.")
+    parser.add_argument("--proc", type=str, default='../data/proc/data3.csv', help="Proc file joined with store predictions.")
+    parser.add_argument("--out", type=str, default=OUT_DIR, help="Output dataset CSV file.")
+    parser.add_argument("--strategy", type=str, default='legacy', choices=STRATEGIES, help="Strata matched when sampling negatives (legacy reproduces AMP_dataset.csv).")
+    parser.add_argument("--width", type=int, default=5, help="Residues per length bin.")
+    parser.add_argument("--bins", type=int, default=4, help="Bins per composition fraction.")
+    parser.add_argument("--seed", type=int, default=SEED, help="Seed for negative sampling.")
+    return parser.parse_args(argv)
+
+# Negative Sampler Selected by Arguments
+def make_sampler(args):
+    return StratifiedSampler(args.strategy, width=args.width, bins=args.bins, seed=args.seed)
 
 # Helper Function for Display
 def data_type(d, r):
@@ -30,86 +50,77 @@ def data_type(d, r):
         r_type = 'RAND' + str(r[1]) if len(r) > 1 else 'REV'
     return d_type, r_type
 
-# Load Original Dataset
-data = {}
-for s in SERVERS:
-    raw = pd.read_csv(DATA_ROOT + s + '.csv')
-    data[s] = {}
-    for d in DATASET:
-        data[s][d] = {}
-        for r in REVERSE:
-            # Append True Values
-            data[s][d][r] = pd.DataFrame(raw[raw.PepID.str.contains(d)]
-                                            [raw.PepID.str.contains('R') == False]
-                                            [raw.AMPLabel == 1])
-
-            # Filter Operations by Type
-            if r == 'R':
-                data[s][d][r] = data[s][d][r].append(raw[raw.PepID.str.contains(d)]
-                                                        [raw.PepID.str.contains('R') == True]
-                                                        [raw.PepID.str.contains('R1') == False]
-                                                        [raw.PepID.str.contains('R2') == False]
-                                                        [raw.PepID.str.contains('R3') == False])
-            elif r != '':
-                data[s][d][r] = data[s][d][r].append(raw[raw.PepID.str.contains(d)]
-                                                        [raw.PepID.str.contains(r)])
-
-            d_type, r_type = data_type(d, r)
+# Load Each Server Result File Once
+def load_servers(root=DATA_ROOT, servers=SERVERS):
+    return {s : pd.read_csv(root + s + '.csv') for s in servers}
 
-# Rebalance Dataset Distribution with Positive Samples
-orig_dist = {}
-for s in SERVERS:
-    raw = pd.read_csv(DATA_ROOT + s + '.csv')
-    orig_dist[s] = {}
-    for d in DATASET:
-        # Evaluate Sequence Length Positive Samples
-        len_count = raw[raw.PepID.str.contains(d)][raw.PepID.str.contains('R') == False][raw.AMPLabel == 1]['PepSeq'].str.len()
+# Load Server Predictions from Result Store Joined with Proc File (Rows in Proc Order, Unpredicted Rows Dropped)
+def load_store(path, dataset, proc_path, servers=SERVERS):
+    store = ResultStore(path)
+    proc = PeptideTable.read_proc(proc_path)
+    frames = {}
+    for s in servers:
+        ids, labels, probs = store.columns(dataset, s)
+        idx = proc.lookup(ids)
+        order = np.argsort(idx[idx >= 0], kind='stable')
+        rows, labels, probs = idx[idx >= 0][order], labels[idx >= 0][order], probs[idx >= 0][order]
+        frames[s] = pd.DataFrame({
+            'PepID' : proc.ids[rows].astype(str),
+            'PepSeq' : [proc.seq(i) for i in rows],
+            'PepType' : proc.types[rows].astype(str),
+            'AMPLabel' : proc.labels[rows].astype(np.int64),
+            'PredScore' : probs,
+            'PredLabel' : labels
+        })
+    store.close()
+    return frames
 
-        # Track Distribution from Positive Samples
-        orig_dist[s][d] = {}
-        for l in len_count:
-            if l not in orig_dist[s][d]:
-                orig_dist[s][d][l] = 0
-            orig_dist[s][d][l] += 1
+# Select Rows per Dataset and Decoy Type (Positives Followed by Decoys of Type r)
+def select(raw, d):
+    pid = raw.PepID.str
+    has_d, has_r = pid.contains(d), pid.contains('R')
+    pos = raw[has_d & ~has_r & (raw.AMPLabel == 1)]
+    neg = raw[has_d & ~has_r & (raw.AMPLabel == 0)]
+    rev = raw[has_d & has_r & ~pid.contains('R1') & ~pid.contains('R2') & ~pid.contains('R3')]
+    decoys = {'R' : rev}
+    for r in REVERSE[2:]: decoys[r] = raw[has_d & pid.contains(r)]
+    return pos, neg, decoys
 
-out_data = []
-for s in SERVERS:
-    raw = pd.read_csv(DATA_ROOT + s + '.csv')
-    for d in DATASET:
-        # Identify Negative Sequence Distribution
-        dat = raw[raw.PepID.str.contains(d)][raw.PepID.str.contains('R') == False][raw.AMPLabel == 0]
-        seq_len = dat['PepSeq'].astype(str).str.len()
+def build_dataset(frames, servers=SERVERS, sampler=None):
+    # Negatives Drawn by Original Per-Length Sampler by Default
+    if sampler is None: sampler = StratifiedSampler('legacy', seed=SEED)
 
-        # Randomly Sample Based on Number of Positive Samples
-        for k in list(orig_dist[s][d]):
-            idx = seq_len[seq_len == k].index.values
-            idx_sel = np.random.choice(len(idx), orig_dist[s][d][k], replace=False)
+    # Collect Rows in Server, Dataset, Decoy Order
+    parts = []
+    for s in servers:
+        for d in DATASET:
+            pos, neg, decoys = select(frames[s], d)
+            parts.append(pos)
+            parts.append(neg.iloc[sampler(pos.PepSeq, neg.PepSeq)])
+            for r in REVERSE[1:]:
+                parts.append(pos)
+                parts.append(decoys[r])
 
-            data[s][d][''] = data[s][d][''].append(dat[dat.index.isin(idx[idx_sel])])
+    # Consolidate Unique (PepID, PepSeq, AMPLabel) Rows - First Occurrence Kept
+    rows = pd.concat(parts)[['PepID', 'PepSeq', 'AMPLabel']].drop_duplicates(keep='first')
 
-        # Collect Pep ID for Consolidation
-        for r in REVERSE:
-            for id in data[s][d][r][['PepID', 'PepSeq', 'AMPLabel']].values.tolist():
-                if id not in out_data: out_data.append(id)
+    # Initialize Output DataFrame Structure
+    out_df = pd.DataFrame({
+        'Database' : rows.PepID.str[0].values,
+        'PepID' : rows.PepID.values,
+        'PepType' : np.where(rows.PepID.str.len() == 6, 'T', rows.PepID.str[6:]),
+        'PepSeq' : rows.PepSeq.values,
+        'PepLabel' : rows.AMPLabel.values
+    })
 
-# Initialize Output DataFrame Structure
-out = []
-for row in out_data:
-    o = [row[0][0], row[0], 'T' if len(row[0]) == 6 else row[0][6:], row[1], row[2]]
-    o += [-1.0 for i in range(len(SERVERS))]
-    out.append(o)
-out_df = pd.DataFrame(out, columns=['Database', 'PepID', 'PepType', 'PepSeq', 'PepLabel'] + SERVERS)
+    # Populate Server Predictions - Hash Join on PepID (Last Prediction per PepID Wins)
+    for s in servers:
+        pred = frames[s].drop_duplicates('PepID', keep='last').set_index('PepID')['PredScore']
+        out_df[s] = np.where(out_df.PepID.isin(pred.index), out_df.PepID.map(pred), -1.0).astype(float)
+    return out_df
 
-# Populate Server Prediction in DataFrame
-for s in SERVERS:
-    '''
-    for d in DATASET:
-        for r in REVERSE:
-            for row in data[s][d][r].values.tolist():
-                out_df.loc[out_df['PepID'] == row[0], s] = row[4]
-    '''
-    raw = pd.read_csv(DATA_ROOT + s + '.csv')
-    for row in raw.values.tolist():
-        out_df.loc[out_df['PepID'] == row[0], s] = row[4]
-        
-out_df.to_csv('../data/AMP_dataset.csv', index=False)
\ No newline at end of file
+if __name__ == '__main__':
+    args = parse_args()
+    sampler = make_sampler(args)
+    frames = load_store(args.store, args.dataset, args.proc) if args.store is not None else load_servers(args.root)
+    build_dataset(frames, sampler=sampler).to_csv(args.out, index=False)
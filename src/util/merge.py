@@ -0,0 +1,198 @@
+'''
+Streaming Result Merger
+Reads the result shards of every server in parallel, resolves duplicate PepIDs,
+and joins the predictions against the proc file chunk by chunk, writing the
+per-server out/ files and a wide PepID x server table in one pass.
+
+Duplicates resolve to a real prediction over -999, then to the last shard in
+file name order. Conflicting predictions, unmatched PepIDs and records without a
+prediction are all reported rather than aborting the merge.
+
+Author: Yuya Jeremy Ong (yjo5006@psu.edu)
+'''
+from __future__ import print_function
+import os
+import argparse
+import numpy as np
+from multiprocessing import Pool
+from store import ResultStore
+
+# Imputed Prediction Marker
+IMPUTED = '-999'
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--results", type=str, help="Result folder holding one shard folder per server.")
+    parser.add_argument("--store", type=str, help="Result store to read predictions from instead of --results.")
+    parser.add_argument("--dataset", type=str, help="Dataset name in result store (e.g. data3.fasta.txt).")
+    parser.add_argument("--servers", type=str, help="Servers to merge, comma separated (default: all found).")
+    parser.add_argument("--proc", type=str, required=True, help="Raw proc file to merge.")
+    parser.add_argument("--out", type=str, required=True, help="Output folder for per-server files.")
+    parser.add_argument("--wide", type=str, help="Output filename of wide table (default: <out>/wide.csv).")
+    parser.add_argument("--conflicts", type=str, help="Output filename of conflict report (default: <out>/conflicts.csv).")
+    parser.add_argument("--workers", type=int, default=4, help="Number of processes reading shard files.")
+    parser.add_argument("--chunk", type=int, default=100000, help="Number of proc rows joined at a time.")
+    return parser.parse_args()
+
+# Read Shard File (PepID,AMPLabel,Prob) as String Columns - Values Kept as Written
+def read_shard(path):
+    rows = [l.rstrip('\r').split(',') for l in open(path, 'r').read().split('\n')[1:] if l != '']
+    rows = [r for r in rows if len(r) >= 3]
+    return (np.array([r[0] for r in rows], dtype=str), np.array([r[1] for r in rows], dtype=str),
+            np.array([r[2] for r in rows], dtype=str))
+
+# Read Shard Files in Parallel (Results in Given File Order)
+def read_shards(files, workers=4):
+    if len(files) == 0: return []
+    pool = Pool(max(1, min(workers, len(files))))
+    shards = pool.map(read_shard, files)
+    pool.close()
+    return shards
+
+class Predictions(object):
+    def __init__(self, ids, labels, probs):
+        self.ids = ids          # PepIDs (sorted, unique)
+        self.labels = labels
+        self.probs = probs
+
+    def __len__(self):
+        return len(self.ids)
+
+    # Row Index of Each PepID (-1 if Absent)
+    def lookup(self, pids):
+        keys = np.asarray(pids, dtype=str)
+        if len(self) == 0: return np.full(len(keys), -1, dtype=np.int64)
+        pos = np.minimum(np.searchsorted(self.ids, keys), len(self) - 1)
+        return np.where(self.ids[pos] == keys, pos, -1)
+
+    # Collapse Shards into One Prediction per PepID - Returns Predictions and Conflicts
+    @classmethod
+    def resolve(cls, shards, sources, server=''):
+        if len(shards) == 0: shards, sources = [(np.zeros(0, dtype=str),) * 3], ['']
+        ids, labels, probs = [np.concatenate([s[c] for s in shards]) for c in range(3)]
+        src = np.repeat(np.arange(len(shards)), [len(s[0]) for s in shards])
+
+        # Last Row per PepID after Sorting by (PepID, Real, Position)
+        order = np.lexsort((np.arange(len(ids)), labels != IMPUTED, ids))
+        sorted_ids = ids[order]
+        first = np.append(True, sorted_ids[1:] != sorted_ids[:-1]) if len(ids) > 0 else np.zeros(0, dtype=bool)
+        starts = np.flatnonzero(first)
+        ends = np.append(starts[1:], len(ids))[:len(starts)]
+        keep = order[ends - 1]
+
+        # Report PepIDs with Differing Real Predictions (Rows Grouped by Sorted Boundaries)
+        conflicts = []
+        dups = ends - starts > 1
+        for a, b in zip(starts[dups].tolist(), ends[dups].tolist()):
+            rows = order[a:b]
+            real = rows[labels[rows] != IMPUTED]
+            if len(set((int(float(labels[r])), float(probs[r])) for r in real)) <= 1: continue
+            detail = '; '.join(sources[src[r]] + '=' + labels[r] + '/' + probs[r] for r in real)
+            conflicts.append([server, sorted_ids[a], 'DUPLICATE', detail + ' -> kept ' + sources[src[order[b - 1]]]])
+        return cls(ids[keep], labels[keep], probs[keep]), conflicts
+
+    # Server Predictions from Result Store
+    @classmethod
+    def from_store(cls, store, dataset, server):
+        ids, labels, probs = store.columns(dataset, server)
+        return cls(ids, np.array([str(l) for l in labels.tolist()], dtype=str), np.array([str(p) for p in probs.tolist()], dtype=str))
+
+# Shard Files of Server Folder (File Name Order)
+def shard_files(folder):
+    return [os.path.join(folder, f) for f in sorted(os.listdir(folder)) if os.path.isfile(os.path.join(folder, f))]
+
+# Read and Resolve Shards of Several Servers - All Shard Files Read in One Process Pool
+def load_servers(folders, workers=4):
+    files = {s : shard_files(f) for s, f in folders.items()}
+    flat = [f for s in folders for f in files[s]]
+    shards = dict(zip(flat, read_shards(flat, workers)))
+    preds, conflicts = {}, []
+    for s in folders:
+        p, c = Predictions.resolve([shards[f] for f in files[s]], [os.path.basename(f) for f in files[s]], s)
+        preds[s] = p
+        conflicts += c
+    return preds, conflicts
+
+# Stream Proc File (PepID,AMPLabel,AMP,PepType) in Chunks of Rows [PepID, AMPLabel, Seq, PepType]
+def iter_proc(path, chunk=100000):
+    rows = []
+    with open(path, 'rb') as f:
+        f.readline()
+        for l in f:
+            r = [c.rstrip('\r') for c in l.decode('ascii').rstrip('\n').split(',')]
+            if len(r) < 4: continue
+            rows.append(r)
+            if len(rows) >= chunk:
+                yield rows
+                rows = []
+    if len(rows) > 0: yield rows
+
+# Join Predictions to Proc Rows - Writes Per-Server Files and Wide Table, Returns Conflicts
+def join(proc, preds, outs, wide=None, chunk=100000):
+    servers = list(preds)
+    files = {s : open(outs[s], 'w') for s in servers}
+    for f in files.values(): f.write('PepID,PepSeq,PepType,AMPLabel,PredScore,PredLabel\n')
+    wide_out = open(wide, 'w') if wide is not None else None
+    if wide_out is not None: wide_out.write('PepID,PepSeq,PepType,AMPLabel,' + ','.join(servers) + '\n')
+
+    conflicts = []
+    seen = {s : np.zeros(len(preds[s]), dtype=bool) for s in servers}
+    for rows in iter_proc(proc, chunk):
+        pids = [r[0] for r in rows]
+        scores = []
+        for s in servers:
+            idx = preds[s].lookup(pids)
+            seen[s][idx[idx >= 0]] = True
+            p = preds[s]
+            score = [p.probs[i] if i >= 0 else IMPUTED for i in idx.tolist()]
+            label = [p.labels[i] if i >= 0 else IMPUTED for i in idx.tolist()]
+            for r, sc, lb, i in zip(rows, score, label, idx.tolist()):
+                files[s].write(r[0] + ',' + r[2] + ',' + r[3] + ',' + r[1] + ',' + sc + ',' + lb + '\n')
+                if i < 0: conflicts.append([s, r[0], 'MISSING', 'no prediction - written as ' + IMPUTED])
+            scores.append(score)
+        if wide_out is None: continue
+        for k, r in enumerate(rows):
+            wide_out.write(r[0] + ',' + r[2] + ',' + r[3] + ',' + r[1] + ',' + ','.join(sc[k] for sc in scores) + '\n')
+
+    # Predictions Never Matched to a Proc Row
+    for s in servers:
+        for pid in preds[s].ids[~seen[s]].tolist(): conflicts.append([s, pid, 'UNMATCHED', 'PepID not in proc file'])
+
+    for f in files.values(): f.close()
+    if wide_out is not None: wide_out.close()
+    return conflicts
+
+def write_conflicts(path, conflicts):
+    with open(path, 'w') as out:
+        out.write('Server,PepID,Conflict,Detail\n')
+        for c in conflicts: out.write(','.join(c) + '\n')
+
+# Print Conflict Counts per Server and Type
+def report(conflicts, path=None):
+    counts = {}
+    for c in conflicts: counts[(c[0], c[2])] = counts.get((c[0], c[2]), 0) + 1
+    for (s, kind), n in sorted(counts.items()): print('>> ' + kind + ' [' + s + ']: ' + str(n))
+    print('> ' + str(len(conflicts)) + ' CONFLICTS' + (' (SEE ' + path + ')' if path is not None and len(conflicts) > 0 else ''))
+
+if __name__ == '__main__':
+    # Parse Arguments
+    args = parse_args()
+    if not os.path.exists(args.out): os.makedirs(args.out)
+    wide = args.wide if args.wide is not None else os.path.join(args.out, 'wide.csv')
+    conflict_path = args.conflicts if args.conflicts is not None else os.path.join(args.out, 'conflicts.csv')
+
+    # Load Deduplicated Predictions per Server
+    if args.store is not None:
+        store = ResultStore(args.store)
+        servers = args.servers.split(',') if args.servers is not None else store.servers(args.dataset)
+        preds, conflicts = {s : Predictions.from_store(store, args.dataset, s) for s in servers}, []
+        store.close()
+    else:
+        servers = args.servers.split(',') if args.servers is not None else sorted(os.listdir(args.results))
+        preds, conflicts = load_servers({s : os.path.join(args.results, s) for s in servers}, args.workers)
+
+    # Join Against Proc File in One Streaming Pass
+    conflicts += join(args.proc, preds, {s : os.path.join(args.out, s + '.csv') for s in servers}, wide, args.chunk)
+    write_conflicts(conflict_path, conflicts)
+    report(conflicts, conflict_path)
+    print('DONE!')
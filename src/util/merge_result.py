@@ -1,36 +1,51 @@
 '''
 Merge CSV Utility
 Merges CSV and Validates Record Against Original - Reports Missing Records
+Reads the shard CSV files of a result folder in parallel, or one server's results
+from the result store. Duplicate PepIDs across overlapping shards resolve to one
+row (real predictions over -999) and conflicting predictions are reported.
 
 Author: Yuya Jeremy Ong (yjo5006@psu.edu)
 '''
 from __future__ import print_function
+import os
 import argparse
-from os import listdir
-from os.path import isfile, join
+from store import ResultStore
+from merge import Predictions, shard_files, read_shards, write_conflicts, report
 
 def parse_args():
     parser = argparse.ArgumentParser()
-    parser.add_argument("--dir", type=str, required=True, help="Dataset folder to merge files with.")
+    parser.add_argument("--dir", type=str, help="Dataset folder to merge files with.")
+    parser.add_argument("--store", type=str, help="Result store to read from instead of --dir.")
+    parser.add_argument("--dataset", type=str, help="Dataset name in result store (e.g. data3.fasta.txt).")
+    parser.add_argument("--server", type=str, help="Server model name in result store (e.g. AMPA).")
     parser.add_argument("--out", type=str, required=True, help="Output filename of csv file.")
+    parser.add_argument("--conflicts", type=str, help="Output filename of conflict report.")
+    parser.add_argument("--workers", type=int, default=4, help="Number of processes reading shard files.")
     return parser.parse_args()
 
 if __name__ == '__main__':
     # Parse Arguments
     args = parse_args()
 
-    # Collect Result to List
-    data = []
-    data_file = [f for f in listdir(args.dir) if isfile(join(args.dir, f))]
-    for file in data_file:
-        raw = open(args.dir + '/' + file, 'r').read().split('\n')[1:-1]
-        data += raw
+    # Collect Result (One Row per PepID, in PepID Order)
+    conflicts = []
+    if args.store is not None:
+        store = ResultStore(args.store)
+        pred = Predictions.from_store(store, args.dataset, args.server)
+        store.close()
+    else:
+        files = shard_files(args.dir)
+        pred, conflicts = Predictions.resolve(read_shards(files, args.workers), [os.path.basename(f) for f in files],
+                                              os.path.basename(os.path.normpath(args.dir)))
 
     # Write to Output File
     out = open(args.out, 'w')
     out.write('PepID,AMPLabel,Prob\n')
-    for row in data: out.write(row + '\n')
+    for i in range(len(pred)): out.write(pred.ids[i] + ',' + pred.labels[i] + ',' + pred.probs[i] + '\n')
     out.close()
 
+    if args.conflicts is not None: write_conflicts(args.conflicts, conflicts)
+    report(conflicts, args.conflicts)
     print('DONE')
-    print('MERGED ' + str(len(data)) + ' RECORDS')
+    print('MERGED ' + str(len(pred)) + ' RECORDS')
@@ -1,66 +1,116 @@
 '''
 Negative Sample Generator
+Builds reversed and k-gram shuffled decoys for whole arrays of peptides at once.
+Every decoy is seeded from its PepID, so results do not depend on how the work
+is split across processes; chunks are generated in parallel and streamed to disk.
+
 Author: Yuya Jeremy Ong (yjo5006@psu.edu)
 '''
 from __future__ import print_function
-import sys
-import math
-import random
+import time
+import argparse
+import numpy as np
+from multiprocessing import Pool
+from peptides import PeptideTable
 
-def kgram(s, k=1):
-    kgram = []
-    for i in range(0, int(math.ceil(len(s) / k))):
-        kgram.append(s[i*k:i*k+k])
-    if len(s)%k > 0: kgram.append(s[-(len(s)%k):])
-    return kgram
+# Application Parameters
+DATA_DIR = '../../data/proc/'
+INPUT_DIR = DATA_DIR + 'data.csv'
+OUT_DIR = DATA_DIR + 'data3.csv'
+SEED = 9892
 
-def reverse_seq(s, k=1):
-    return ''.join(kgram(s, k)[::-1])
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input", type=str, default=INPUT_DIR, help="Proc file to generate decoys from.")
+    parser.add_argument("--out", type=str, default=OUT_DIR, help="Output proc file (input rows followed by decoys).")
+    parser.add_argument("--k", type=int, default=3, help="Generate k-gram shuffles for k = 1..K.")
+    parser.add_argument("--seed", type=int, default=SEED, help="Base seed for per-peptide decoy seeds.")
+    parser.add_argument("--workers", type=int, default=4, help="Number of worker processes.")
+    parser.add_argument("--chunk", type=int, default=100000, help="Number of peptides per work unit.")
+    return parser.parse_args()
 
-def shuffle_seq(s, k=1):
-    seq = kgram(s, k)
-    random.shuffle(seq)
-    return ''.join(seq)
+# SplitMix64 Finalizer - Vectorized Counter-Based Random Numbers
+def mix(x):
+    x = (x + np.uint64(0x9E3779B97F4A7C15)).astype(np.uint64)
+    x = ((x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)).astype(np.uint64)
+    x = ((x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)).astype(np.uint64)
+    return x ^ (x >> np.uint64(31))
 
-def read_csv(dir, ignore_header=True):
-    st = 1 if ignore_header else 0
-    data = open(dir, 'r').read().split('\n')[st:-1]
+# Per-Peptide Seeds - FNV-1a over PepID Bytes Mixed with Base Seed
+def peptide_seeds(ids, seed):
+    cells = np.ascontiguousarray(ids).view(np.uint8).reshape(len(ids), -1)
+    h = np.full(len(ids), 0xCBF29CE484222325, dtype=np.uint64)
+    with np.errstate(over='ignore'):
+        for c in cells.T:
+            upd = (h ^ c.astype(np.uint64)) * np.uint64(0x100000001B3)
+            h = np.where(c != 0, upd, h)
+        return mix(h ^ np.uint64(seed))
 
-    raw_data = []
-    for i in range(0, len(data), 2):
-        raw_data.append(data[i].split(',') + [data[i+1].split(',')[1]])
+# Reverse Every Sequence in One Gather
+def reverse_seqs(residues, offsets):
+    lens = np.diff(offsets)
+    rows = np.repeat(np.arange(len(lens)), lens)
+    pos = np.arange(offsets[0], offsets[-1])
+    return residues[offsets[rows] + offsets[rows + 1] - 1 - pos], offsets - offsets[0]
 
-    return raw_data
+# Shuffle k-Grams Within Every Sequence (Chunk Order Drawn from Per-Peptide Seeds)
+def shuffle_seqs(residues, offsets, seeds, k):
+    lens = np.diff(offsets)
+    n_chunks = (lens + k - 1) // k
+    rows = np.repeat(np.arange(len(lens)), n_chunks)
+    first = np.concatenate([[0], np.cumsum(n_chunks)])[:-1]
+    idx = np.arange(len(rows)) - first[rows]
+    src = offsets[rows] + idx * k
+    size = np.minimum(src + k, offsets[rows + 1]) - src
 
-if __name__ == '__main__':
-    # Application Parameters
-    DATA_DIR = '../../data/proc/'
-    INPUT_DIR = DATA_DIR + 'data.csv'
-    OUT_DIR = DATA_DIR + 'data3.csv'
+    # Random Key per Chunk - Sort Chunks by (Peptide, Key)
+    with np.errstate(over='ignore'):
+        keys = mix(mix(seeds[rows] ^ np.uint64(k)) ^ idx.astype(np.uint64))
+    order = np.lexsort((keys, rows))
+    src, size = src[order], size[order]
 
-    # Read CSV File
-    data = read_csv(INPUT_DIR)
+    # Expand Shuffled Chunks Back to Residues
+    out_start = np.concatenate([[0], np.cumsum(size)])[:-1]
+    pos = np.arange(size.sum()) - np.repeat(out_start, size) + np.repeat(src, size)
+    return residues[pos], offsets - offsets[0]
 
-    # Process Negative Samples
-    neg_pep = []
-    for d in data:
-        print(d)
-        if d[1] == '1':
-            # Reversed Sequence
-            neg_pep.append([d[0]+'R', 0, reverse_seq(d[2]), 'REVERSE'])
+# Generate Decoys for Chunk of Peptides - Returns Rendered Proc Rows
+def generate(args):
+    table, k, seed = args
+    seeds = peptide_seeds(table.ids, seed)
+    decoys = [(reverse_seqs(table.residues, table.offsets), b'R', 'REVERSE')]
+    for j in range(1, k + 1):
+        decoys.append((shuffle_seqs(table.residues, table.offsets, seeds, j), b'R' + str(j).encode('ascii'), 'RANDOM' + str(j)))
 
-            # Randomized K-Gram Sequence
-            for k in range(1, 4):
-                neg_pep.append([d[0]+'R'+str(k), 0, shuffle_seq(d[2], k), 'RANDOM'+str(k)])
+    out = []
+    tables = [PeptideTable(res, off, np.char.add(table.ids, suffix), np.zeros(len(table), dtype=np.int8),
+                           np.full(len(table), type.encode('ascii'))) for (res, off), suffix, type in decoys]
+    for i in range(len(table)):
+        for t in tables: out.append(','.join([str(c) for c in t[i]]))
+    return '\n'.join(out) + '\n' if len(out) > 0 else ''
 
-    # TODO: Ask whether to merge the positive examples together with the negative samples.
-    data += neg_pep
+if __name__ == '__main__':
+    args = parse_args()
+    start = time.time()
 
-    print('Generated Fake Data:\t' + str(len(neg_pep)))
-    print('Total Sample Size:\t' + str(len(data)))
+    # Read CSV File
+    data = PeptideTable.read_proc(args.input)
+    positives = data.take(np.flatnonzero(data.labels == 1))    # Decoys Only Generated for AMPs
 
-    # Generate Output File
-    out = open(OUT_DIR, 'w')
+    # Generate Output File - Input Rows Followed by Decoys (Streamed Chunk by Chunk)
+    # TODO: Ask whether to merge the positive examples together with the negative samples.
+    out = open(args.out, 'w')
     out.write('PepID,AMPLabel,AMP,PepType\n')
-    for d in data: out.write(','.join([str(i) for i in d])+'\n')
+    for d in data: out.write(','.join([str(i) for i in d]) + '\n')
+
+    units = ((positives.take(np.arange(i, min(i + args.chunk, len(positives)))), args.k, args.seed)
+             for i in range(0, len(positives), args.chunk))
+    pool = Pool(args.workers)
+    for rows in pool.imap(generate, units): out.write(rows)
+    pool.close()
     out.close()
+
+    n_fake = len(positives) * (args.k + 1)
+    print('Generated Fake Data:\t' + str(n_fake))
+    print('Total Sample Size:\t' + str(len(data) + n_fake))
+    print('Elapsed Time:\t\t{:.2f}s'.format(time.time() - start))
@@ -3,53 +3,44 @@ Output File Merge: Generate Final Output Based on Specified Schema
 Author: Yuya Jeremy Ong (yjo5006@psu.edu)
 '''
 from __future__ import print_function
-import sys
+import os
 import argparse
+from store import ResultStore
+from merge import Predictions, read_shard, join, write_conflicts, report
 
 def parse_args():
     parser = argparse.ArgumentParser()
     parser.add_argument("--proc", type=str, required=True, help="Raw proc file to merge.")
-    parser.add_argument("--res", type=str, required=True, help="Prediction results file.")
+    parser.add_argument("--res", type=str, help="Prediction results file.")
+    parser.add_argument("--store", type=str, help="Result store to read predictions from instead of --res.")
+    parser.add_argument("--dataset", type=str, help="Dataset name in result store (e.g. data3.fasta.txt).")
+    parser.add_argument("--server", type=str, help="Server model name in result store (e.g. AMPA).")
     parser.add_argument("--out", type=str, required=True, help="Output filename of csv file.")
+    parser.add_argument("--conflicts", type=str, help="Output filename of conflict report.")
+    parser.add_argument("--chunk", type=int, default=100000, help="Number of proc rows joined at a time.")
     return parser.parse_args()
 
 if __name__ == '__main__':
     # Parse Arguments
     args = parse_args()
 
-    # Build Data Dict
-    data = {}
-    proc = open(args.proc, 'r').read().split('\n')[1:-1]
-    for i in range(0, len(proc)):
-        '''
-        row = proc[i].replace('\n', '').split(',')
-        type = proc[i+1].replace('\n','').split(',')[1]
-        data[row[0]] = {'PepSeq' : row[2], 'PepType' : type, 'AMPLabel' : row[1]}
-        '''
-        row = proc[i].replace('\n', '').split(',')
-        data[row[0]] = {'PepSeq' : row[2], 'PepType' : row[3], 'AMPLabel' : row[1]}
-
-    # Merge with Predictions
-    pred = open(args.res, 'r').read().split('\n')[1:-1]
-    for p in pred:
-        row = p.split(',')
-        data[row[0]]['PredScore'] = row[2]
-        data[row[0]]['PredLabel'] = row[1]
-
-    # Validate Merge
-    for d in data:
-        if len(data[d].keys()) != 5:
-            print('INVALID FILE!')
-            sys.exit()
-
-    print('MERGE COMPLETE - DATASET VALID!')
-
-    # Output File
-    output = open(args.out, 'w')
-    output.write('PepID,PepSeq,PepType,AMPLabel,PredScore,PredLabel\n')
-    for d in data:
-        row = d+','+data[d]['PepSeq']+','+data[d]['PepType']+','+data[d]['AMPLabel']+','+data[d]['PredScore']+','+data[d]['PredLabel']+'\n'
-        output.write(row)
-    output.close()
+    # Load Predictions (Duplicate PepIDs Resolved)
+    if args.store is not None:
+        store = ResultStore(args.store)
+        name = args.server
+        pred, conflicts = Predictions.from_store(store, args.dataset, args.server), []
+        store.close()
+    else:
+        name = os.path.basename(args.res)
+        pred, conflicts = Predictions.resolve([read_shard(args.res)], [name], name)
+
+    # Merge with Proc File (Streamed - Records Without Prediction Written as -999)
+    conflicts += join(args.proc, {name : pred}, {name : args.out}, chunk=args.chunk)
+
+    # Report Merge Conflicts Instead of Aborting
+    if len(conflicts) == 0: print('MERGE COMPLETE - DATASET VALID!')
+    else: print('MERGE COMPLETE - ' + str(len(conflicts)) + ' CONFLICTS')
+    if args.conflicts is not None: write_conflicts(args.conflicts, conflicts)
+    report(conflicts, args.conflicts)
 
     print('DONE!')
@@ -0,0 +1,141 @@
+'''
+Compact Peptide Table
+Peptide sequences stored as uint8 residue codes in one contiguous buffer with
+an offsets array, alongside columnar PepID, AMPLabel and PepType arrays.
+Slices share the underlying buffers, and tables save to and load from a folder
+of memory-mapped .npy files.
+
+Author: Yuya Jeremy Ong (yjo5006@psu.edu)
+'''
+from __future__ import print_function
+import os
+import numpy as np
+
+# Columns Stored per Table (Saved as <column>.npy)
+COLUMNS = ['residues', 'offsets', 'ids', 'labels', 'types']
+
+class PeptideTable(object):
+    def __init__(self, residues, offsets, ids, labels, types):
+        self.residues = residues    # uint8 residue codes (ASCII) of all sequences
+        self.offsets = offsets      # int64 [n+1] sequence boundaries into residues
+        self.ids = ids              # Fixed width bytes PepIDs
+        self.labels = labels        # int8 AMPLabel
+        self.types = types          # Fixed width bytes PepType
+
+    def __len__(self):
+        return len(self.ids)
+
+    def lengths(self):
+        return np.diff(self.offsets)
+
+    def seq(self, i):
+        return self.residues[self.offsets[i]:self.offsets[i+1]].tobytes().decode('ascii')
+
+    def id(self, i):
+        return self.ids[i].decode('ascii')
+
+    # Row as Proc Record [PepID, AMPLabel, AMP, PepType] - Slice as Zero-Copy Table View
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            st, ed, step = i.indices(len(self))
+            if step != 1: raise ValueError('PeptideTable slices must be contiguous.')
+            return PeptideTable(self.residues, self.offsets[st:ed+1], self.ids[st:ed], self.labels[st:ed], self.types[st:ed])
+        return [self.id(i), int(self.labels[i]), self.seq(i), self.types[i].decode('ascii')]
+
+    def __iter__(self):
+        for i in range(len(self)): yield self[i]
+
+    # Gather Rows into New Compact Table (Sequences Copied in One Pass)
+    def take(self, idx):
+        idx = np.asarray(idx, dtype=np.int64)
+        lens = self.offsets[idx + 1] - self.offsets[idx]
+        offsets = np.concatenate([[0], np.cumsum(lens)])
+        residues = self.residues[np.repeat(self.offsets[idx] - offsets[:-1], lens) + np.arange(offsets[-1])]
+        return PeptideTable(residues, offsets, self.ids[idx], self.labels[idx], self.types[idx])
+
+    # Row Index of Each PepID (-1 if Absent) - Vectorized over Sorted IDs
+    def lookup(self, pids):
+        # Compare at Widest Width (Casting Keys to ID Width Would Truncate e.g. A00001R to A00001)
+        keys = np.array(pids, dtype=bytes)
+        if len(self) == 0 or len(keys) == 0: return np.full(len(keys), -1, dtype=np.int64)
+        width = 'S' + str(max(self.ids.dtype.itemsize, keys.dtype.itemsize))
+        ids, keys = self.ids.astype(width), keys.astype(width)
+        order = np.argsort(ids, kind='stable')
+        pos = np.minimum(np.searchsorted(ids[order], keys), len(self) - 1)
+        return np.where(ids[order][pos] == keys, order[pos], -1)
+
+    # Build from Python Columns (Sequences Packed into One Buffer)
+    @classmethod
+    def from_columns(cls, ids, labels, seqs, types):
+        lens = np.fromiter(map(len, seqs), dtype=np.int64, count=len(seqs))
+        residues = np.frombuffer(''.join(seqs).encode('ascii'), dtype=np.uint8).copy()
+        return cls(residues, np.concatenate([[0], np.cumsum(lens)]), np.array(ids, dtype=bytes),
+                   np.asarray(labels, dtype=np.int8), np.array(types, dtype=bytes))
+
+    # Concatenate Tables (Sequence Buffers Copied Once)
+    @classmethod
+    def concat(cls, tables):
+        residues = np.concatenate([t.residues[t.offsets[0]:t.offsets[-1]] for t in tables])
+        lens = np.concatenate([t.lengths() for t in tables])
+        width = max(t.ids.dtype.itemsize for t in tables)
+        type_width = max(t.types.dtype.itemsize for t in tables)
+        return cls(residues, np.concatenate([[0], np.cumsum(lens)]),
+                   np.concatenate([t.ids.astype('S' + str(width)) for t in tables]),
+                   np.concatenate([t.labels for t in tables]),
+                   np.concatenate([t.types.astype('S' + str(type_width)) for t in tables]))
+
+    # Read Proc CSV (PepID,AMPLabel,AMP,PepType) - Fields Cut Vectorized from Raw Bytes
+    @classmethod
+    def read_proc(cls, path, ignore_header=True):
+        raw = np.fromfile(path, dtype=np.uint8)
+        if len(raw) == 0: return cls.from_columns([], [], [], [])
+        nl = np.flatnonzero(raw == ord('\n'))
+        starts = np.concatenate([[0], nl + 1])
+        ends = np.append(nl, len(raw))
+        keep = ends > starts
+        if ignore_header: keep[:1] = False
+        starts, ends = starts[keep], ends[keep]
+
+        # Three Commas per Row Delimit the Four Fields
+        commas = np.flatnonzero(raw == ord(','))
+        commas = commas[np.searchsorted(commas, starts)[:, None] + np.arange(3)] if len(starts) > 0 else np.zeros((0, 3), dtype=np.int64)
+        bounds = np.column_stack([starts, commas + 1])
+        fields_end = np.column_stack([commas, ends])
+        fields_end = fields_end - ((raw[np.maximum(fields_end - 1, 0)] == ord('\r')) & (fields_end > bounds))
+
+        # Pack Sequences (Field 2) into One Buffer
+        seq_st, seq_ed = bounds[:, 2], fields_end[:, 2]
+        lens = seq_ed - seq_st
+        mark = np.zeros(len(raw) + 1, dtype=np.int64)
+        np.add.at(mark, seq_st, 1)
+        np.add.at(mark, seq_ed, -1)
+        residues = raw[np.cumsum(mark)[:-1] > 0]
+
+        return cls(residues, np.concatenate([[0], np.cumsum(lens)]), _cut(raw, bounds[:, 0], fields_end[:, 0]),
+                   _cut(raw, bounds[:, 1], fields_end[:, 1]).astype(np.int8), _cut(raw, bounds[:, 3], fields_end[:, 3]))
+
+    def write_proc(self, path):
+        with open(path, 'w') as out:
+            out.write('PepID,AMPLabel,AMP,PepType\n')
+            for r in self: out.write(','.join([str(i) for i in r]) + '\n')
+
+    def write_fasta(self, path):
+        with open(path, 'w') as out:
+            for i in range(len(self)): out.write('>' + self.id(i) + '\n' + self.seq(i) + '\n')
+
+    # Save Columns to Folder (Sliced Views Compacted First)
+    def save(self, path):
+        if not os.path.exists(path): os.makedirs(path)
+        table = self if self.offsets[0] == 0 and self.offsets[-1] == len(self.residues) else PeptideTable.concat([self])
+        for c in COLUMNS: np.save(os.path.join(path, c + '.npy'), getattr(table, c))
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        return cls(*[np.load(os.path.join(path, c + '.npy'), mmap_mode='r' if mmap else None) for c in COLUMNS])
+
+# Gather Variable Width Fields [st, ed) of Raw Bytes into Fixed Width Bytes Array
+def _cut(raw, st, ed):
+    width = max(1, int((ed - st).max())) if len(st) > 0 else 1
+    idx = st[:, None] + np.arange(width)
+    cells = np.where(idx < ed[:, None], raw[np.minimum(idx, len(raw) - 1)], 0).astype(np.uint8)
+    return np.ascontiguousarray(cells).view('S' + str(width)).ravel()
@@ -0,0 +1,123 @@
+'''
+Result Store
+Single indexed SQLite file holding every server prediction keyed by (dataset,
+server, PepID), replacing the per-shard result CSV trees. Runs append batch
+results as they arrive, and a server's results load as a column read over the
+memory-mapped database file.
+
+Author: Yuya Jeremy Ong (yjo5006@psu.edu)
+'''
+from __future__ import print_function
+import os
+import time
+import sqlite3
+import argparse
+import threading
+import numpy as np
+
+# Bytes of Database File Memory-Mapped for Reads
+MMAP_SIZE = 1 << 30
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--store", type=str, default='../../data/results.db', help="Result store to import into.")
+    parser.add_argument("--dataset", type=str, required=True, help="Dataset name (FASTA file name, e.g. data3.fasta.txt).")
+    parser.add_argument("--server", type=str, required=True, help="Server model name (e.g. AMPA, CMPR3_SVM).")
+    parser.add_argument("--csv", type=str, nargs='+', required=True, help="Result CSV file(s) (PepID,AMPLabel,Prob) to import.")
+    return parser.parse_args()
+
+class ResultStore(object):
+    def __init__(self, path):
+        self.path = path
+        if os.path.dirname(path) != '' and not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA mmap_size=' + str(MMAP_SIZE))
+        self._conn.execute('''CREATE TABLE IF NOT EXISTS results (
+                                dataset TEXT, server TEXT, pep_id TEXT,
+                                label INTEGER, prob REAL, updated REAL,
+                                PRIMARY KEY (dataset, server, pep_id)) WITHOUT ROWID''')
+        self._conn.execute('''CREATE TABLE IF NOT EXISTS retries (
+                                dataset TEXT, server TEXT, pep_id TEXT, attempts INTEGER,
+                                PRIMARY KEY (dataset, server, pep_id)) WITHOUT ROWID''')
+        self._conn.commit()
+
+    # Append Batch Results [PepID, Label, Prob] - Imputed -999 Never Replaces a Real Prediction
+    def append(self, dataset, server, results):
+        if len(results) == 0: return
+        with self._lock:
+            now = time.time()
+            self._conn.executemany('''INSERT INTO results VALUES (?, ?, ?, ?, ?, ?)
+                                      ON CONFLICT (dataset, server, pep_id) DO UPDATE
+                                      SET label=excluded.label, prob=excluded.prob, updated=excluded.updated
+                                      WHERE excluded.label != -999 OR results.label = -999''',
+                                   [(dataset, server, r[0], int(r[1]), float(r[2]), now) for r in results])
+            self._conn.commit()
+
+    # Results of One Server as Columns (PepIDs, Labels, Probs) Sorted by PepID
+    def columns(self, dataset, server):
+        with self._lock:
+            rows = self._conn.execute('''SELECT pep_id, label, prob FROM results
+                                         WHERE dataset=? AND server=? ORDER BY pep_id''', (dataset, server)).fetchall()
+        ids = np.array([r[0] for r in rows], dtype=str)
+        labels = np.fromiter((r[1] for r in rows), dtype=np.int64, count=len(rows))
+        probs = np.fromiter((r[2] for r in rows), dtype=np.float64, count=len(rows))
+        return ids, labels, probs
+
+    # Results of One Server as Rows [PepID, Label, Prob]
+    def rows(self, dataset, server):
+        ids, labels, probs = self.columns(dataset, server)
+        return [[i, l, p] for i, l, p in zip(ids.tolist(), labels.tolist(), probs.tolist())]
+
+    # PepIDs with Real Predictions (-999 Imputed Rows Excluded)
+    def done(self, dataset, server):
+        ids, labels, _ = self.columns(dataset, server)
+        return set(ids[labels != -999].tolist())
+
+    # Retry Attempts Made per PepID
+    def attempts(self, dataset, server):
+        with self._lock:
+            return dict(self._conn.execute('SELECT pep_id, attempts FROM retries WHERE dataset=? AND server=?', (dataset, server)).fetchall())
+
+    # Count One Retry Attempt for Each PepID
+    def retried(self, dataset, server, pids):
+        if len(pids) == 0: return
+        with self._lock:
+            self._conn.executemany('''INSERT INTO retries VALUES (?, ?, ?, 1)
+                                      ON CONFLICT (dataset, server, pep_id) DO UPDATE SET attempts=attempts+1''',
+                                   [(dataset, server, pid) for pid in pids])
+            self._conn.commit()
+
+    def count(self, dataset, server):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM results WHERE dataset=? AND server=?', (dataset, server)).fetchone()[0]
+
+    def datasets(self):
+        with self._lock:
+            return [r[0] for r in self._conn.execute('SELECT DISTINCT dataset FROM results ORDER BY dataset')]
+
+    def servers(self, dataset):
+        with self._lock:
+            return [r[0] for r in self._conn.execute('SELECT DISTINCT server FROM results WHERE dataset=? ORDER BY server', (dataset,))]
+
+    def close(self):
+        with self._lock: self._conn.close()
+
+# Read Result CSV File (PepID,AMPLabel,Prob) as Rows
+def read_result(path):
+    rows = [l.split(',') for l in open(path, 'r').read().split('\n')[1:] if l != '']
+    return [[r[0], int(r[1]), float(r[2])] for r in rows]
+
+if __name__ == '__main__':
+    # Import Existing Result CSV Files into Store
+    args = parse_args()
+    store = ResultStore(args.store)
+    for f in args.csv:
+        rows = read_result(f)
+        store.append(args.dataset, args.server, rows)
+        print('> IMPORTED ' + str(len(rows)) + ' RECORDS: ' + f)
+    print('> ' + args.dataset + ' / ' + args.server + ': ' + str(store.count(args.dataset, args.server)) + ' RECORDS')
+    store.close()
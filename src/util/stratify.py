@@ -0,0 +1,90 @@
+'''
+Stratified Negative Sampler
+Draws negatives whose stratum histogram (exact length, length bins or length and
+composition bins) matches the positive set in one vectorized pass: candidates get
+a random key, are ranked within their stratum, and the first n of each stratum
+are kept. The legacy strategy keeps the original per-length draws that built
+AMP_dataset.csv.
+
+Author: Yuya Jeremy Ong (yjo5006@psu.edu)
+'''
+from __future__ import print_function
+import numpy as np
+
+# Sampling Strategies and Residue Classes Used for Composition Bins
+STRATEGIES = ['legacy', 'length', 'length_bin', 'composition']
+CATIONIC = 'KRH'
+HYDROPHOBIC = 'AILMFVWC'
+
+# Pack Sequences into One uint8 Buffer (Returns Residues, Lengths)
+def encode(seqs):
+    seqs = [str(s) for s in seqs]
+    lens = np.fromiter(map(len, seqs), dtype=np.int64, count=len(seqs))
+    return np.frombuffer(''.join(seqs).encode('ascii'), dtype=np.uint8), lens
+
+# Fraction of Residues per Sequence Belonging to Alphabet
+def fraction(residues, lens, alphabet):
+    table = np.zeros(256, dtype=np.int64)
+    table[np.frombuffer(alphabet.encode('ascii'), dtype=np.uint8)] = 1
+    hits = np.concatenate([[0], np.cumsum(table[residues])])
+    ends = np.cumsum(lens)
+    return (hits[ends] - hits[ends - lens]) / np.maximum(lens, 1).astype(float)
+
+class StratifiedSampler(object):
+    def __init__(self, strategy='length', width=5, bins=4, seed=None):
+        if strategy not in STRATEGIES: raise ValueError('Unknown sampling strategy: ' + str(strategy))
+
+        # Sampler Parameters
+        self.strategy = strategy
+        self.width = width      # Residues per length bin
+        self.bins = bins        # Bins per composition fraction
+        self.rng = np.random.default_rng(seed)
+        self.legacy_rng = np.random.RandomState(seed)   # Same Draws as Original np.random.seed Sampler
+
+    # Integer Stratum Key per Sequence
+    def strata(self, seqs):
+        residues, lens = encode(seqs)
+        if self.strategy == 'length': return lens
+        if self.strategy == 'length_bin': return lens // self.width
+
+        # Composition - Length Bin x Cationic Fraction Bin x Hydrophobic Fraction Bin
+        cat = np.minimum((fraction(residues, lens, CATIONIC) * self.bins).astype(np.int64), self.bins - 1)
+        hyd = np.minimum((fraction(residues, lens, HYDROPHOBIC) * self.bins).astype(np.int64), self.bins - 1)
+        return ((lens // self.width) * self.bins + cat) * self.bins + hyd
+
+    # Original Sampler - One choice() per Positive Length (Lengths in Order of First Appearance)
+    def _legacy(self, pos_seqs, neg_seqs):
+        lens = encode(pos_seqs)[1]
+        neg_lens = encode(neg_seqs)[1]
+        uniq, first, counts = np.unique(lens, return_index=True, return_counts=True)
+        order = np.argsort(neg_lens, kind='stable')
+        sorted_lens = neg_lens[order]
+
+        picked = [np.zeros(0, dtype=np.int64)]
+        for k in np.argsort(first, kind='stable'):
+            idx = order[np.searchsorted(sorted_lens, uniq[k], side='left'):np.searchsorted(sorted_lens, uniq[k], side='right')]
+            picked.append(np.sort(idx[self.legacy_rng.choice(len(idx), counts[k], replace=False)]))
+        return np.concatenate(picked)
+
+    # Positions of Sampled Negatives (In Candidate Order, Legacy in Length Order) Matching Positive Strata Counts
+    def __call__(self, pos_seqs, neg_seqs):
+        if self.strategy == 'legacy': return self._legacy(pos_seqs, neg_seqs)
+        keys, need = np.unique(self.strata(pos_seqs), return_counts=True)
+        neg_keys = self.strata(neg_seqs)
+        if len(keys) == 0: return np.zeros(0, dtype=np.int64)
+
+        # Rank Candidates Randomly Within Stratum
+        order = np.lexsort((self.rng.random(len(neg_keys)), neg_keys))
+        sorted_keys = neg_keys[order]
+        rank = np.arange(len(order)) - np.searchsorted(sorted_keys, sorted_keys, side='left')
+
+        # Report Strata with Too Few Candidates (All of Their Candidates are Kept)
+        avail = np.searchsorted(sorted_keys, keys, side='right') - np.searchsorted(sorted_keys, keys, side='left')
+        if (avail < need).any():
+            short = avail < need
+            print('>> SHORT STRATA: ' + str(int(short.sum())) + ' ' + self.strategy + ' strata missing ' + str(int((need - avail)[short].sum())) + ' negatives')
+
+        # Keep First need[k] Candidates of Each Stratum k
+        slot = np.minimum(np.searchsorted(keys, sorted_keys), len(keys) - 1)
+        quota = np.where(keys[slot] == sorted_keys, need[slot], 0)
+        return np.sort(order[rank < quota])
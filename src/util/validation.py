@@ -1,50 +1,86 @@
 '''
 Result Validation Assertion
-Given original dataset file and folder of results, report any missing samples.
+Given original dataset file and the results of every server, report missing
+samples (absent or imputed with -999) and write one retry FASTA file per server
+in a single streaming pass over the original dataset.
 
 Author: Yuya Jeremy Ong
 '''
 from __future__ import print_function
+import os
 import argparse
+from fasta import Fasta
+from store import ResultStore
+
+# Application Parameters
+SERVERS = ['ADAM_HMM', 'ADAM_SVM', 'AMPA', 'CMPR3_ANN', 'CMPR3_DA', 'CMPR3_RF', 'CMPR3_SVM', 'DBAASP']
 
 def parse_args():
     parser = argparse.ArgumentParser()
     parser.add_argument("--orig", type=str, required=True, help="Original dataset to assert from.")
-    parser.add_argument("--data", type=str, required=True, help="Input data to assert against.")
-    parser.add_argument("--missing", type=str, required=True, help="Output for writing missing list.")
-    return parser.parse_args()
+    parser.add_argument("--data", type=str, help="Single result file to assert against (written to --missing).")
+    parser.add_argument("--missing", type=str, help="Output for writing missing list of --data (required with --data).")
+    parser.add_argument("--dir", type=str, help="Folder of merged <server>.csv result files to assert against.")
+    parser.add_argument("--store", type=str, help="Result store to assert against (dataset keyed by --orig file name).")
+    parser.add_argument("--dataset", type=str, help="Dataset name in result store (defaults to --orig file name).")
+    parser.add_argument("--servers", type=str, default=','.join(SERVERS), help="Servers to check, comma separated.")
+    parser.add_argument("--out", type=str, default='../../data/missing/', help="Output folder for per-server retry FASTA files.")
+    args = parser.parse_args()
+    if args.data is not None and args.missing is None: parser.error('--missing is required with --data')
+    return args
+
+# PepIDs with Real Predictions in Result CSV File (-999 Imputed Rows Excluded)
+def read_done(path):
+    done = set()
+    for l in open(path, 'r').read().split('\n')[1:]:
+        r = l.split(',')
+        if len(r) >= 3 and r[1] != '-999': done.add(r[0])
+    return done
 
-def find_idx(data, pid):
-    index = 0
-    for d in data:
-        if d[1:] == pid: break
-        index += 1
-    return index
+# Stream Original Dataset Once - Every Record Missing from a Server is Written to its Retry File
+def validate(orig, done, outputs):
+    missing = {s : 0 for s in done}
+    files = {}
+    for pid, seq in orig:
+        for s in done:
+            if pid in done[s]: continue
+            if s not in files: files[s] = open(outputs[s], 'w')
+            files[s].write('>' + pid + '\n' + seq + '\n')
+            missing[s] += 1
+    for f in files.values(): f.close()
+    return missing
 
 if __name__ == '__main__':
     # Parse Arguments
     args = parse_args()
 
-    # Read Dataset
-    orig_raw = open(args.orig, 'r').read().split('\n')[:-1]
-    test_raw = open(args.data, 'r').read().split('\n')[1:-1]
-
-    # Build Dictionary of Original Data
-    orig_id = list(map(lambda x: x[1:], orig_raw[::2]))
-    test = { x.split(',')[0] : {'AMPLabel':x.split(',')[1], 'Prob':x.split(',')[2]} for x in test_raw }
+    # Read Dataset (Indexed - PepIDs Hashed)
+    orig = Fasta(args.orig)
 
-    # Find Missing Index
-    missing = list(set(orig_id) - set(test.keys()))
+    # Collect Completed PepIDs per Server
+    done, outputs = {}, {}
+    if args.data is not None:
+        done[args.data] = read_done(args.data)
+        outputs[args.data] = args.missing
+    else:
+        if not os.path.exists(args.out): os.makedirs(args.out)
+        store = ResultStore(args.store) if args.store is not None else None
+        dataset = args.dataset if args.dataset is not None else args.orig.split('/')[-1]
+        for s in args.servers.split(','):
+            if store is not None: done[s] = store.done(dataset, s)
+            elif args.dir is not None:
+                # Skip Servers Without Result File (e.g. Older Runs Named CAMPR3-SVM.csv)
+                if not os.path.exists(os.path.join(args.dir, s + '.csv')):
+                    print('> WARNING: NO RESULT FILE FOR [' + s + '] IN ' + args.dir + ' - SKIPPED')
+                    continue
+                done[s] = read_done(os.path.join(args.dir, s + '.csv'))
+            else: done[s] = set()
+            outputs[s] = os.path.join(args.out, s + '_' + args.orig.split('/')[-1])
+        if store is not None: store.close()
 
-    if len(missing) > 0:
-        # Generate Missing List
-        miss_out = open(args.missing, 'w')
-        for m in missing:
-            idx = find_idx(orig_raw, m)
-            miss_out.write(orig_raw[idx] + '\n')
-            miss_out.write(orig_raw[idx+1] + '\n')
-        miss_out.close()
+    missing = validate(orig, done, outputs)
 
     # Report Stats
     print('DONE')
-    print('MISSING: ' + str(len(missing)) + ' / ' + str(len(orig_id)) + ' RECORDS')
+    for s in done:
+        print('MISSING [' + s + ']: ' + str(missing[s]) + ' / ' + str(len(orig)) + ' RECORDS' + (' -> ' + outputs[s] if missing[s] > 0 else ''))